@@ -0,0 +1,37 @@
+import typing
+from .detection import CompiledRole
+from .listing import MESSAGE_MAX_LENGTH
+
+# Packs the members notified for the same role in the same channel into shared messages,
+# up to `max_mentions` members and Discord's message length.
+# `submit` is called with (guild, channel, [(member, role), ...]) for each full batch.
+class NotificationBatcher:
+    def __init__(self, submit: typing.Callable[[typing.Any, typing.Any, list[tuple[typing.Any, CompiledRole]]], typing.Awaitable[None]], max_mentions: int = 20, max_length: int = MESSAGE_MAX_LENGTH):
+        self.submit = submit
+        self.max_mentions: int = max_mentions
+        self.max_length: int = max_length
+        self._batches: dict[tuple[int, int], tuple[typing.Any, typing.Any, CompiledRole, list]] = {}
+
+    async def add(self, guild, channel, member, role: CompiledRole) -> None:
+        key = (channel.id, role.id)
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = (guild, channel, role, [])
+        members = batch[3]
+        members.append(member)
+        if len(members) > 1 and len(role.template.render_many([member.id for member in members])) > self.max_length:
+            # Too long with this member, send the batch without it
+            members.pop()
+            await self._flush(key)
+            self._batches[key] = (guild, channel, role, [member])
+        elif len(members) >= self.max_mentions:
+            await self._flush(key)
+
+    async def flush(self) -> None:
+        for key in list(self._batches):
+            await self._flush(key)
+
+    async def _flush(self, key: tuple[int, int]) -> None:
+        guild, channel, role, members = self._batches.pop(key)
+        if members:
+            await self.submit(guild, channel, [(member, role) for member in members])
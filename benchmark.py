@@ -0,0 +1,579 @@
+# Offline benchmark of the BAM cog against a simulated Discord.
+# Fake guilds, roles, members, channels and messages stand in for discord.py objects, and every
+# API call goes through a FakeAPI adding latency and answering 429s when a route is called too fast.
+#
+# Run it from the bot directory (where `log`, `filehelper`... can be imported):
+#   python -m plugins.bam.benchmark --members 100000 --roles 50 --tracked 1000000
+# Files are written in a temporary directory, the cog logs are discarded unless --verbose.
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+import typing
+import discord
+from .main import BAM
+from .cluster import shard_of
+from .pipeline import TokenBucket
+from .store import TrackedMessage
+
+####                              ####
+#           Simulated API            #
+####                              ####
+
+# Counts the API calls per route, sleeps `latency` seconds (+/- jitter) per call
+# and raises RateLimited when a route exceeds `route_rate` calls per second,
+# or randomly with probability `rate_limit_ratio`.
+class FakeAPI:
+    def __init__(self, latency: float = 0.05, jitter: float = 0.5, route_rate: float = 5.0, route_burst: int = 5, rate_limit_ratio: float = 0.0):
+        self.latency: float = latency
+        self.jitter: float = jitter
+        self.route_rate: float = route_rate
+        self.route_burst: int = route_burst
+        self.rate_limit_ratio: float = rate_limit_ratio
+        self.calls: dict[str, int] = {}
+        self.rate_limited: int = 0
+        self.in_flight: int = 0
+        self._buckets: dict[tuple[str, int], TokenBucket] = {}
+
+    async def call(self, route: str, key: int = 0) -> None:
+        self.calls[route] = self.calls.get(route, 0) + 1
+        bucket = self._buckets.get((route, key))
+        if bucket is None:
+            bucket = self._buckets[(route, key)] = TokenBucket(self.route_rate, self.route_burst)
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+            now = time.monotonic()
+            retry_after = bucket.delay(now)
+            if retry_after <= 0 and random.random() < self.rate_limit_ratio:
+                retry_after = self.latency
+            if retry_after > 0:
+                self.rate_limited += 1
+                raise discord.RateLimited(retry_after)
+            bucket.consume(now)
+        finally:
+            self.in_flight -= 1
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def reset(self) -> None:
+        self.calls.clear()
+        self.rate_limited = 0
+
+####                              ####
+#            Fake entities           #
+####                              ####
+
+class FakeRole:
+    def __init__(self, guild: "FakeGuild", role_id: int, name: str):
+        self.guild = guild
+        self.id: int = role_id
+        self.name: str = name
+        self.position: int = 1
+        self.mentionable: bool = True
+        self.created_at = discord.utils.snowflake_time(role_id)
+
+    @property
+    def members(self) -> list["FakeMember"]:
+        return [member for member in self.guild.members.values() if self.id in member._roles]
+
+# discord.Member subclass so `isinstance(author, discord.Member)` holds, the discord.py
+# properties and slots are shadowed by plain attributes
+class FakeMember(discord.Member):
+    id = name = guild = bot = _roles = None
+
+    def __init__(self, guild: "FakeGuild", member_id: int, role_ids: list[int]):
+        self.id = member_id
+        self.name = f"member-{member_id}"
+        self.guild = guild
+        self.bot = False
+        self._roles = list(role_ids)
+
+    def copy(self) -> "FakeMember":
+        return FakeMember(self.guild, self.id, self._roles)
+
+class FakeMessage:
+    def __init__(self, api: FakeAPI, channel: "FakeChannel", message_id: int, author, content: str = ""):
+        self.api = api
+        self.channel = channel
+        self.guild = channel.guild
+        self.id: int = message_id
+        self.author = author
+        self.content: str = content
+        self.created_at = discord.utils.snowflake_time(message_id)
+
+    async def reply(self, content: str, **kwargs) -> "FakeMessage":
+        return await self.channel.send(content)
+
+    async def add_reaction(self, emoji) -> None:
+        await self.api.call("add_reaction", self.channel.id)
+
+    async def delete(self) -> None:
+        await self.channel.delete_message_ids([self.id])
+
+class FakePartialMessage:
+    def __init__(self, channel: "FakeChannel", message_id: int):
+        self.channel = channel
+        self.id: int = message_id
+
+    async def delete(self) -> None:
+        await self.channel.delete_message_ids([self.id])
+
+class FakeChannel:
+    def __init__(self, api: FakeAPI, guild: "FakeGuild", channel_id: int, name: str):
+        self.api = api
+        self.guild = guild
+        self.id: int = channel_id
+        self.name: str = name
+        self.messages: dict[int, FakeMessage] = {}
+
+    async def send(self, content: str) -> FakeMessage:
+        await self.api.call("send", self.id)
+        message = FakeMessage(self.api, self, self.guild.world.next_id(), self.guild.world.bot.user, content)
+        self.messages[message.id] = message
+        return message
+
+    async def fetch_message(self, message_id: int) -> FakeMessage:
+        await self.api.call("fetch_message", self.id)
+        message = self.messages.get(message_id)
+        if message is None:
+            raise discord.NotFound(types.SimpleNamespace(status=404, reason="Not Found"), "Unknown Message")
+        return message
+
+    def get_partial_message(self, message_id: int) -> FakePartialMessage:
+        return FakePartialMessage(self, message_id)
+
+    async def delete_messages(self, messages: list) -> None:
+        await self.delete_message_ids([message.id for message in messages], route="bulk_delete")
+
+    async def delete_message_ids(self, message_ids: list[int], route: str = "delete") -> None:
+        await self.api.call(route, self.id)
+        if route == "delete" and message_ids[0] not in self.messages:
+            raise discord.NotFound(types.SimpleNamespace(status=404, reason="Not Found"), "Unknown Message")
+        for message_id in message_ids:
+            self.messages.pop(message_id, None)
+
+    async def history(self, limit: int = 100, after=None, oldest_first: bool = True):
+        await self.api.call("history", self.id)
+        message_ids = sorted(message_id for message_id in self.messages if after is None or message_id > after.id)
+        for message_id in message_ids[:limit]:
+            yield self.messages[message_id]
+
+class FakeGuild:
+    def __init__(self, world: "FakeWorld", guild_id: int):
+        self.world = world
+        self.id: int = guild_id
+        self.name: str = f"guild-{guild_id}"
+        self.chunked: bool = True
+        self.unavailable: bool = False
+        self.members: dict[int, FakeMember] = {}
+        self.roles: dict[int, FakeRole] = {}
+        self.channels: dict[int, FakeChannel] = {}
+
+    @property
+    def member_count(self) -> int:
+        return len(self.members)
+
+    @property
+    def shard_id(self) -> int:
+        return shard_of(self.id, self.world.bot.shard_count or 1)
+
+    def get_member(self, member_id: int) -> typing.Optional[FakeMember]:
+        return self.members.get(member_id)
+
+    def get_role(self, role_id: int) -> typing.Optional[FakeRole]:
+        return self.roles.get(role_id)
+
+    async def fetch_member(self, member_id: int) -> FakeMember:
+        await self.world.api.call("fetch_member", self.id)
+        member = self.members.get(member_id)
+        if member is None:
+            raise discord.NotFound(types.SimpleNamespace(status=404, reason="Not Found"), "Unknown Member")
+        return member
+
+    # Pages of 1000 members sorted by id, like the REST endpoint
+    async def fetch_members(self, limit: int = None, after=None):
+        member_ids = sorted(self.members)
+        start = 0
+        if after is not None:
+            start = next((i for i, member_id in enumerate(member_ids) if member_id > after.id), len(member_ids))
+        for i in range(start, len(member_ids), 1000):
+            await self.world.api.call("fetch_members", self.id)
+            for member_id in member_ids[i:i + 1000]:
+                yield self.members[member_id]
+
+    async def query_members(self, user_ids: list[int] = None, cache: bool = True, **kwargs) -> list[FakeMember]:
+        await self.world.api.call("query_members", self.id)
+        return [self.members[member_id] for member_id in user_ids or () if member_id in self.members]
+
+class FakeBot:
+    def __init__(self, world: "FakeWorld"):
+        self.world = world
+        self.user = types.SimpleNamespace(id=world.next_id(), name="bam", bot=True)
+        self.intents = discord.Intents.default()
+        self.intents.members = True
+        self._connection = types.SimpleNamespace(parsers={})
+        # Every shard runs in this process (AutoShardedBot)
+        self.shard_count: typing.Optional[int] = None
+        self.shard_ids: typing.Optional[list[int]] = None
+
+    @property
+    def guilds(self) -> list[FakeGuild]:
+        return list(self.world.guilds.values())
+
+    def get_guild(self, guild_id: int) -> typing.Optional[FakeGuild]:
+        return self.world.guilds.get(guild_id)
+
+    def get_channel(self, channel_id: int) -> typing.Optional[FakeChannel]:
+        return self.world.channels.get(channel_id)
+
+    def get_partial_messageable(self, channel_id: int):
+        return self.world.channels.get(channel_id)
+
+    async def fetch_channel(self, channel_id: int) -> FakeChannel:
+        await self.world.api.call("fetch_channel")
+        channel = self.world.channels.get(channel_id)
+        if channel is None:
+            raise discord.NotFound(types.SimpleNamespace(status=404, reason="Not Found"), "Unknown Channel")
+        return channel
+
+    def is_ready(self) -> bool:
+        return True
+
+    async def wait_until_ready(self) -> None:
+        return
+
+class FakeContext:
+    def __init__(self, world: "FakeWorld", channel: FakeChannel):
+        self.bot = world.bot
+        self.guild = channel.guild
+        self.channel = channel
+        self.author = next(iter(channel.guild.members.values()))
+        # The command message exists in its channel, commands delete it
+        self.message = FakeMessage(world.api, channel, world.next_id(), self.author)
+        channel.messages[self.message.id] = self.message
+
+    async def send(self, content: str = None, **kwargs):
+        return FakeMessage(self.channel.api, self.channel, self.channel.guild.world.next_id(), self.bot.user, content or "")
+
+    async def reply(self, content: str = None, **kwargs):
+        return await self.send(content, **kwargs)
+
+# The simulated Discord: `guilds` guilds of `members` members in total, `roles` tracked roles
+# notifying in `channels` channels per guild, each member holding a tracked role with probability `role_ratio`
+class FakeWorld:
+    def __init__(self, api: FakeAPI, guilds: int, members: int, roles: int, channels: int, role_ratio: float):
+        self.api = api
+        self._next_id = discord.utils.time_snowflake(discord.utils.utcnow())
+        self.guilds: dict[int, FakeGuild] = {}
+        self.channels: dict[int, FakeChannel] = {}
+        self.role_configs: list[dict] = []
+        self.bot = FakeBot(self)
+        for g in range(guilds):
+            guild = FakeGuild(self, self.next_id())
+            self.guilds[guild.id] = guild
+            guild_channels = []
+            for c in range(channels):
+                channel = FakeChannel(api, guild, self.next_id(), f"notifs-{c}")
+                guild.channels[channel.id] = channel
+                self.channels[channel.id] = channel
+                guild_channels.append(channel)
+            guild_roles = []
+            for r in range(roles // guilds + (1 if g < roles % guilds else 0)):
+                role = FakeRole(guild, self.next_id(), f"role-{r}")
+                guild.roles[role.id] = role
+                guild_roles.append(role)
+                self.role_configs.append({
+                    "enabled": True,
+                    "id": role.id,
+                    "channel_notif": guild_channels[r % len(guild_channels)].id,
+                    "emoji": None,
+                    "cooldown": 60,
+                    "message": "Welcome <@{user_id}>!",
+                })
+            for m in range(members // guilds):
+                role_ids = [random.choice(guild_roles).id] if guild_roles and random.random() < role_ratio else []
+                member = FakeMember(guild, self.next_id(), role_ids)
+                guild.members[member.id] = member
+
+    def next_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    def members(self) -> list[FakeMember]:
+        return [member for guild in self.guilds.values() for member in guild.members.values()]
+
+    def tracked_roles(self, guild: FakeGuild) -> list[FakeRole]:
+        return list(guild.roles.values())
+
+####                              ####
+#             Measurement            #
+####                              ####
+
+class Result:
+    def __init__(self, name: str):
+        self.name: str = name
+        self.count: int = 0
+        self.duration: float = 0.0
+        self.latencies: list[float] = []
+        self.api_calls: dict[str, int] = {}
+        self.rate_limited: int = 0
+        self.peak_memory: int = 0
+        self.extra: str = ""
+
+    def percentile(self, p: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    def report(self) -> str:
+        lines = [f"== {self.name}: {self.count} ops in {self.duration:.3f}s ({self.count / self.duration if self.duration > 0 else 0:.1f} ops/s)"]
+        if self.latencies:
+            lines.append(f"   latency ms: mean {statistics.fmean(self.latencies) * 1000:.3f}, p50 {self.percentile(50) * 1000:.3f}, p95 {self.percentile(95) * 1000:.3f}, p99 {self.percentile(99) * 1000:.3f}, max {max(self.latencies) * 1000:.3f}")
+        calls = ", ".join(f"{route} {count}" for route, count in sorted(self.api_calls.items())) or "none"
+        lines.append(f"   API calls: {sum(self.api_calls.values())} ({calls}), 429s: {self.rate_limited}")
+        if self.peak_memory:
+            lines.append(f"   peak memory: {self.peak_memory / 1024 / 1024:.1f} MiB")
+        if self.extra:
+            lines.append(f"   {self.extra}")
+        return "\n".join(lines)
+
+class Benchmark:
+    def __init__(self, args: argparse.Namespace, out: typing.TextIO):
+        self.args = args
+        self.out: typing.TextIO = out
+        self.results: list[Result] = []
+
+    @contextlib.contextmanager
+    def measure(self, name: str, api: FakeAPI) -> typing.Iterator[Result]:
+        result = Result(name)
+        api.reset()
+        if self.args.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield result
+        finally:
+            result.duration = time.perf_counter() - start
+            result.api_calls = dict(api.calls)
+            result.rate_limited = api.rate_limited
+            if self.args.trace_memory:
+                result.peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            self.results.append(result)
+
+    # Wait until the queued work is processed and no API call is running
+    async def drain(self, cog: BAM, api: FakeAPI) -> None:
+        while True:
+            await asyncio.sleep(0.01)
+            if not len(cog.work_queue) and not len(cog.member_updates) and api.in_flight == 0:
+                await asyncio.sleep(0.01)
+                if not len(cog.work_queue) and api.in_flight == 0:
+                    return
+
+    def create_cog(self, world: FakeWorld) -> BAM:
+        cog = BAM(world.bot)
+        cog.reconciler_enabled = False
+        cog.periodic_scan_enabled = False
+        cog.verbose_logging = self.args.verbose
+        cog.member_updates.window = self.args.update_window
+        # Scan sends are limited by the fake API, not by the pipeline
+        cog.pipeline.channel_rate = cog.pipeline.guild_rate = self.args.send_rate
+        cog.pipeline.channel_burst = cog.pipeline.guild_burst = max(1, int(self.args.send_rate))
+        for config in world.role_configs:
+            cog.role_index.add(dict(config))
+        return cog
+
+    async def run(self) -> None:
+        args = self.args
+        random.seed(args.seed)
+        api = FakeAPI(args.latency, route_rate=args.route_rate, rate_limit_ratio=args.rate_limit_ratio)
+        build_start = time.perf_counter()
+        world = FakeWorld(api, args.guilds, args.members, args.roles, args.channels, args.role_ratio)
+        world.bot.shard_count = args.shards
+        print(f"World: {len(world.guilds)} guilds, {args.members} members, {len(world.role_configs)} tracked roles, {len(world.channels)} channels (built in {time.perf_counter() - build_start:.1f}s)", file=self.out)
+
+        cog = self.create_cog(world)
+        await cog.cog_load()
+        try:
+            await self.bench_on_message(cog, world, api)
+            await self.bench_on_member_update(cog, world, api)
+            await self.bench_fetch_roles(cog, world, api)
+            cog = await self.bench_hot_reload(cog, world, api)
+            await self.bench_save_load(cog, world, api)
+            await self.bench_clear(cog, world, api)
+        finally:
+            await cog.cog_unload()
+            handoff = getattr(world.bot, "_bam_handoff", None)
+            if handoff is not None:
+                handoff["release"]()
+
+        for result in self.results:
+            print(result.report(), file=self.out)
+        print(f"Max RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB", file=self.out)
+
+    # Messages from random members, a part of them holding a tracked role
+    async def bench_on_message(self, cog: BAM, world: FakeWorld, api: FakeAPI) -> None:
+        members = world.members()
+        channels = list(world.channels.values())
+        with self.measure("on_message", api) as result:
+            for _ in range(self.args.messages):
+                member = random.choice(members)
+                channel = random.choice([channel for channel in channels if channel.guild is member.guild] or channels)
+                message = FakeMessage(api, channel, world.next_id(), member, "hello")
+                start = time.perf_counter()
+                await cog.on_message(message)
+                result.latencies.append(time.perf_counter() - start)
+                result.count += 1
+            await self.drain(cog, api)
+            result.extra = f"work queue: {cog.work_queue.queued} queued, {cog.work_queue.merged} merged, {cog.work_queue.dropped} dropped; {len(cog.msg_tracked)} tracked"
+
+    # Members gaining a tracked role
+    async def bench_on_member_update(self, cog: BAM, world: FakeWorld, api: FakeAPI) -> None:
+        members = world.members()
+        with self.measure("on_member_update", api) as result:
+            for _ in range(self.args.updates):
+                after = random.choice(members)
+                roles = world.tracked_roles(after.guild)
+                if not roles:
+                    continue
+                before = after.copy()
+                role = random.choice(roles)
+                if role.id not in after._roles:
+                    after._roles.append(role.id)
+                start = time.perf_counter()
+                await cog.on_member_update(before, after)
+                result.latencies.append(time.perf_counter() - start)
+                result.count += 1
+            await self.drain(cog, api)
+            result.extra = f"{len(cog.msg_tracked)} tracked"
+
+    # A full scan, then a second one where every member is inside its cooldown
+    async def bench_fetch_roles(self, cog: BAM, world: FakeWorld, api: FakeAPI) -> None:
+        for name in ("fetch_roles", "fetch_roles (cooldowns)"):
+            with self.measure(name, api) as result:
+                job = await cog.fetch_roles()
+                # Skipped members are counted in `submitted` too
+                result.count = job.submitted
+                result.extra = job.progress()
+
+    # Unload the cog and load a new one claiming its state, as `reload_extension` does.
+    # Fails if the scheduled cooldown resends are lost on the way, returns the new cog
+    async def bench_hot_reload(self, cog: BAM, world: FakeWorld, api: FakeAPI) -> BAM:
+        cog.cooldown_scheduler.start()
+        scheduled = len(cog.cooldown_scheduler._heap)
+        with self.measure("hot reload", api) as result:
+            await cog.cog_unload()
+            reloaded = self.create_cog(world)
+            reloaded.periodic_scan_enabled = True
+            await reloaded.cog_load()
+            result.count = len(reloaded.msg_tracked)
+            kept = len(reloaded.cooldown_scheduler._heap)
+            result.extra = f"{kept}/{scheduled} scheduled cooldowns kept"
+        # Only the cooldowns were needed, keep the next scenarios free of periodic scans
+        reloaded.stop_periodic_scan()
+        reloaded.periodic_scan_enabled = False
+        if kept != scheduled:
+            raise RuntimeError(f"Hot reload lost scheduled cooldowns: {kept}/{scheduled} kept")
+        return reloaded
+
+    # Snapshot of `tracked` entries, saved then loaded again
+    async def bench_save_load(self, cog: BAM, world: FakeWorld, api: FakeAPI) -> None:
+        self.fill_store(cog, world, self.args.tracked, create_messages=False)
+        count = len(cog.msg_tracked)
+        with self.measure("save_tracked_messages", api) as result:
+            await cog.save_tracked_messages()
+            result.count = count
+        path = os.path.join("save", cog.tracked_msg_save_file)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+
+        loaded = self.create_cog(world)
+        with self.measure("load_tracked_messages", api) as result:
+            await loaded.load_tracked_messages()
+            result.count = len(loaded.msg_tracked)
+            result.extra = f"file size: {size / 1024 / 1024:.1f} MiB"
+        if loaded.journal is not None:
+            loaded.journal.close()
+
+    # Delete `clear` tracked messages existing in the fake channels
+    async def bench_clear(self, cog: BAM, world: FakeWorld, api: FakeAPI) -> None:
+        cog.msg_tracked.clear()
+        self.fill_store(cog, world, self.args.clear, create_messages=True)
+        channel = next(iter(world.channels.values()))
+        ctx = FakeContext(world, channel)
+        with self.measure("clearTrackedMessages", api) as result:
+            result.count = len(cog.msg_tracked)
+            await BAM.clearTrackedMessages.callback(cog, ctx)
+            result.extra = f"{sum(len(channel.messages) for channel in world.channels.values())} messages left in the channels"
+
+    # Track a message for (member, role) pairs, cycling through the members and roles
+    def fill_store(self, cog: BAM, world: FakeWorld, count: int, create_messages: bool) -> None:
+        members = world.members()
+        now = time.time()
+        added = 0
+        for config in world.role_configs:
+            if added >= count:
+                break
+            channel = world.channels[config["channel_notif"]]
+            for member in members:
+                if added >= count:
+                    break
+                if member.guild is not channel.guild:
+                    continue
+                message_id = world.next_id()
+                if create_messages:
+                    channel.messages[message_id] = FakeMessage(world.api, channel, message_id, world.bot.user)
+                cog.msg_tracked.add(TrackedMessage(channel.guild.id, member.id, config["id"], channel.id, message_id, now))
+                added += 1
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the BAM cog against a simulated Discord")
+    parser.add_argument("--guilds", type=int, default=1)
+    parser.add_argument("--shards", type=int, default=1, help="shards of the simulated bot, scans feed them concurrently")
+    parser.add_argument("--members", type=int, default=10000, help="members in total")
+    parser.add_argument("--roles", type=int, default=50, help="tracked roles in total")
+    parser.add_argument("--channels", type=int, default=5, help="notification channels per guild")
+    parser.add_argument("--role-ratio", type=float, default=0.1, help="ratio of members holding a tracked role")
+    parser.add_argument("--messages", type=int, default=10000, help="messages sent to on_message")
+    parser.add_argument("--updates", type=int, default=1000, help="role updates sent to on_member_update")
+    parser.add_argument("--tracked", type=int, default=100000, help="tracked messages saved and loaded")
+    parser.add_argument("--clear", type=int, default=10000, help="tracked messages deleted by clearTrackedMessages")
+    parser.add_argument("--latency", type=float, default=0.02, help="API latency in seconds")
+    parser.add_argument("--route-rate", type=float, default=50.0, help="API calls per second allowed per route and channel before a 429")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="probability of a random 429")
+    parser.add_argument("--send-rate", type=float, default=50.0, help="pipeline sends per second per channel and guild")
+    parser.add_argument("--update-window", type=float, default=0.05, help="member update coalescing window in seconds")
+    parser.add_argument("--trace-memory", action="store_true", help="measure the peak memory of each scenario (slower)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="keep the cog logs")
+    return parser.parse_args(argv)
+
+def main(argv: list[str] = None) -> None:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    benchmark = Benchmark(args, sys.stdout)
+    with tempfile.TemporaryDirectory(prefix="bam-benchmark-") as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            with contextlib.ExitStack() as stack:
+                if not args.verbose:
+                    # Keep the report readable: the cog logs every event
+                    devnull = stack.enter_context(open(os.devnull, "w"))
+                    stack.enter_context(contextlib.redirect_stdout(devnull))
+                asyncio.run(benchmark.run())
+        finally:
+            os.chdir(cwd)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import asyncio
+import os
+import sqlite3
+import time
+import typing
+import log
+from .store import TrackedMessage, TrackedMessageStore
+
+# Discord routes the events of a guild to shard (guild_id >> 22) % shard_count
+def shard_of(guild_id: int, shard_count: int) -> int:
+    return (guild_id >> 22) % shard_count
+
+# Insert the cluster id before the extension of a save file: tracked_messages.bam.json -> tracked_messages.bam.1.json
+def partition_file(file_name: str, cluster_id: typing.Optional[int]) -> str:
+    if cluster_id is None:
+        return file_name
+    root, extension = os.path.splitext(file_name)
+    return f"{root}.{cluster_id}{extension}"
+
+# The guilds owned by this process: those of its shards.
+# Without sharding (or when the shards are not known yet) the process owns every guild.
+class ShardPartition:
+    def __init__(self, shard_ids: typing.Optional[typing.Iterable[int]] = None, shard_count: typing.Optional[int] = None, cluster_id: typing.Optional[int] = None):
+        self.shard_count: typing.Optional[int] = shard_count if shard_count and shard_count > 1 else None
+        self.shard_ids: typing.Optional[frozenset[int]] = frozenset(shard_ids) if shard_ids is not None and self.shard_count is not None else None
+        self.cluster_id: typing.Optional[int] = cluster_id
+
+    # Shards from the config, or from the bot (AutoShardedBot.shard_ids or Bot.shard_id)
+    @classmethod
+    def from_bot(cls, bot, config: dict) -> "ShardPartition":
+        shard_count = config.get("shard_count") or getattr(bot, "shard_count", None)
+        shard_ids = config.get("shard_ids") or getattr(bot, "shard_ids", None)
+        if shard_ids is None and getattr(bot, "shard_id", None) is not None:
+            shard_ids = [bot.shard_id]
+        if shard_ids is None and shard_count:
+            # Sharded in a single process: every shard is local
+            shard_ids = range(shard_count)
+        partition = cls(shard_ids, shard_count, config.get("cluster_id"))
+        if partition.cluster_id is None and partition.partitioned:
+            partition.cluster_id = min(partition.shard_ids)
+        return partition
+
+    @property
+    def partitioned(self) -> bool:
+        return self.shard_ids is not None and len(self.shard_ids) < self.shard_count
+
+    def owns(self, guild_id: int) -> bool:
+        return self.shard_ids is None or shard_of(guild_id, self.shard_count) in self.shard_ids
+
+    # Group the owned guilds by shard, so each shard can be processed on its own
+    def by_shard(self, guilds: typing.Iterable) -> dict[int, list]:
+        groups: dict[int, list] = {}
+        for guild in guilds:
+            if self.owns(guild.id):
+                groups.setdefault(guild.shard_id or 0, []).append(guild)
+        return groups
+
+    def describe(self) -> str:
+        if self.shard_ids is None:
+            return "all guilds"
+        return f"cluster {self.cluster_id}, shards {sorted(self.shard_ids)} of {self.shard_count}"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (cluster_id INTEGER PRIMARY KEY, shards TEXT NOT NULL, heartbeat REAL NOT NULL, tracked INTEGER NOT NULL DEFAULT 0, published REAL);
+CREATE TABLE IF NOT EXISTS tracked (cluster_id INTEGER NOT NULL, guild_id INTEGER NOT NULL, member_id INTEGER NOT NULL, role_id INTEGER NOT NULL, channel_id INTEGER NOT NULL, message_id INTEGER NOT NULL, timestamp REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS tracked_cluster ON tracked (cluster_id);
+CREATE TABLE IF NOT EXISTS requests (id INTEGER PRIMARY KEY AUTOINCREMENT, origin INTEGER NOT NULL, command TEXT NOT NULL, created REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS acks (request_id INTEGER NOT NULL, cluster_id INTEGER NOT NULL, finished REAL NOT NULL, result TEXT, PRIMARY KEY (request_id, cluster_id));
+"""
+
+# Coordination of the bot processes of a cluster through a SQLite file shared on the host.
+# Each process heartbeats, publishes a copy of its tracked messages every `publish_interval` seconds
+# (for cluster-wide listings) and polls the requests broadcast by the others (e.g. `scan all`),
+# acknowledging them with a result once handled. Every query runs in a worker thread.
+# `handler` runs a request command and returns its result.
+class ClusterCoordinator:
+    def __init__(self, path: str, partition: ShardPartition, store: TrackedMessageStore, handler: typing.Callable[[str], typing.Awaitable[str]], poll_interval: float = 5.0, publish_interval: float = 300.0):
+        self.path: str = path
+        self.partition: ShardPartition = partition
+        self.cluster_id: int = partition.cluster_id or 0
+        self.store: TrackedMessageStore = store
+        self.handler = handler
+        self.poll_interval: float = poll_interval
+        self.publish_interval: float = publish_interval
+        self._last_request: typing.Optional[int] = None
+        self._last_publish: typing.Optional[float] = None
+        self._task: typing.Optional[asyncio.Task] = None
+        self._handling: set[asyncio.Task] = set()
+
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def _execute(self, callback: typing.Callable[[sqlite3.Connection], typing.Any]) -> typing.Any:
+        connection = self._connect()
+        try:
+            with connection:
+                return callback(connection)
+        finally:
+            connection.close()
+
+    async def run(self, callback: typing.Callable[[sqlite3.Connection], typing.Any]) -> typing.Any:
+        return await asyncio.to_thread(self._execute, callback)
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.is_running():
+            return
+        def setup(connection: sqlite3.Connection) -> int:
+            connection.executescript(SCHEMA)
+            # Requests broadcast before this process started are not replayed
+            return connection.execute("SELECT COALESCE(MAX(id), 0) FROM requests").fetchone()[0]
+        self._last_request = await self.run(setup)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in self._handling:
+            task.cancel()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.heartbeat()
+                if self._last_publish is None or time.monotonic() - self._last_publish >= self.publish_interval:
+                    await self.publish()
+                await self.poll_requests()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error(f"Cluster coordination failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def heartbeat(self) -> None:
+        shards = ",".join(str(shard_id) for shard_id in sorted(self.partition.shard_ids or ()))
+        tracked = len(self.store)
+        await self.run(lambda connection: connection.execute(
+            "INSERT INTO nodes (cluster_id, shards, heartbeat, tracked) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (cluster_id) DO UPDATE SET shards = excluded.shards, heartbeat = excluded.heartbeat, tracked = excluded.tracked",
+            (self.cluster_id, shards, time.time(), tracked)))
+
+    # Replace the published copy of the local tracked messages. Only the list of entries is copied
+    # on the event loop (like a journal snapshot), the rows are built in the worker thread
+    async def publish(self) -> None:
+        entries = list(self.store)
+        def replace(connection: sqlite3.Connection):
+            connection.execute("DELETE FROM tracked WHERE cluster_id = ?", (self.cluster_id,))
+            connection.executemany("INSERT INTO tracked VALUES (?, ?, ?, ?, ?, ?, ?)", ([self.cluster_id] + entry.to_row() for entry in entries))
+            connection.execute("UPDATE nodes SET published = ? WHERE cluster_id = ?", (time.time(), self.cluster_id))
+        await self.run(replace)
+        self._last_publish = time.monotonic()
+
+    # Nodes which heartbeated recently: (cluster id, shards, tracked messages, seconds since published or None)
+    async def live_nodes(self) -> list[tuple[int, str, int, typing.Optional[float]]]:
+        since = time.time() - self.poll_interval * 3
+        rows = await self.run(lambda connection: connection.execute(
+            "SELECT cluster_id, shards, tracked, published FROM nodes WHERE heartbeat >= ? ORDER BY cluster_id", (since,)).fetchall())
+        now = time.time()
+        return [(cluster_id, shards, tracked, now - published if published is not None else None) for cluster_id, shards, tracked, published in rows]
+
+    # Tracked messages published by the other live nodes, filtered like the local listing
+    async def remote_tracked(self, guild_id: int = None, role_id: int = None, member_id: int = None, older: float = None, newer: float = None) -> list[TrackedMessage]:
+        clauses = ["cluster_id != ?", "cluster_id IN (SELECT cluster_id FROM nodes WHERE heartbeat >= ?)"]
+        params: list = [self.cluster_id, time.time() - self.poll_interval * 3]
+        for clause, value in (("guild_id = ?", guild_id), ("role_id = ?", role_id), ("member_id = ?", member_id), ("timestamp <= ?", older), ("timestamp >= ?", newer)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        query = "SELECT guild_id, member_id, role_id, channel_id, message_id, timestamp FROM tracked WHERE " + " AND ".join(clauses)
+        rows = await self.run(lambda connection: connection.execute(query, params).fetchall())
+        return [TrackedMessage.from_row(row) for row in rows]
+
+    # Ask the other nodes to run a command, returns the request id
+    async def broadcast(self, command: str) -> int:
+        return await self.run(lambda connection: connection.execute(
+            "INSERT INTO requests (origin, command, created) VALUES (?, ?, ?)", (self.cluster_id, command, time.time())).lastrowid)
+
+    # Wait until the given nodes acknowledged a request, returns their results by cluster id
+    async def wait_acks(self, request_id: int, cluster_ids: typing.Iterable[int], timeout: float) -> dict[int, str]:
+        expected = set(cluster_ids)
+        deadline = time.monotonic() + timeout
+        while True:
+            rows = await self.run(lambda connection: connection.execute(
+                "SELECT cluster_id, result FROM acks WHERE request_id = ?", (request_id,)).fetchall())
+            results = {cluster_id: result for cluster_id, result in rows}
+            if expected.issubset(results) or time.monotonic() >= deadline:
+                return results
+            await asyncio.sleep(self.poll_interval)
+
+    async def poll_requests(self) -> None:
+        last_request = self._last_request or 0
+        rows = await self.run(lambda connection: connection.execute(
+            "SELECT id, command FROM requests WHERE id > ? AND origin != ? ORDER BY id", (last_request, self.cluster_id)).fetchall())
+        for request_id, command in rows:
+            self._last_request = request_id
+            # Requests run concurrently with the coordination loop (a scan may take a while)
+            task = asyncio.get_running_loop().create_task(self._handle(request_id, command))
+            self._handling.add(task)
+            task.add_done_callback(self._handling.discard)
+
+    async def _handle(self, request_id: int, command: str) -> None:
+        log.info(f"Cluster request {request_id}: {command}")
+        try:
+            result = await self.handler(command)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.error(f"Cluster request {request_id} failed: {e}")
+            result = f"failed: {e}"
+        await self.run(lambda connection: connection.execute(
+            "INSERT OR REPLACE INTO acks (request_id, cluster_id, finished, result) VALUES (?, ?, ?, ?)",
+            (request_id, self.cluster_id, time.time(), result)))
+
+    # Remove the rows of this node, so the others stop listing them
+    async def leave(self) -> None:
+        def remove(connection: sqlite3.Connection):
+            connection.execute("DELETE FROM tracked WHERE cluster_id = ?", (self.cluster_id,))
+            connection.execute("DELETE FROM nodes WHERE cluster_id = ?", (self.cluster_id,))
+        await self.run(remove)
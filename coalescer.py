@@ -0,0 +1,53 @@
+import asyncio
+import typing
+import log
+
+# Merge bursts of calls for the same key into a single call.
+# The first call for a key starts a `window` seconds timer, later calls during that window
+# only replace the pending value, and the callback runs once with the latest value.
+class Coalescer:
+    def __init__(self, callback: typing.Callable[[typing.Any], typing.Awaitable[None]], window: float = 2.0):
+        self.callback = callback
+        self.window: float = window
+        self._pending: dict[typing.Hashable, typing.Any] = {}
+        self._timers: dict[typing.Hashable, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def __contains__(self, key: typing.Hashable) -> bool:
+        return key in self._pending
+
+    def push(self, key: typing.Hashable, value: typing.Any) -> None:
+        self._pending[key] = value
+        if key not in self._timers:
+            self._timers[key] = asyncio.get_running_loop().call_later(self.window, self._fire, key)
+
+    # Replace the value of a pending key, without scheduling anything if there is none
+    def update(self, key: typing.Hashable, value: typing.Any) -> None:
+        if key in self._pending:
+            self._pending[key] = value
+
+    def cancel(self) -> None:
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        self._pending.clear()
+        for task in self._tasks:
+            task.cancel()
+
+    def _fire(self, key: typing.Hashable) -> None:
+        self._timers.pop(key, None)
+        value = self._pending.pop(key, None)
+        if value is None:
+            return
+        task = asyncio.get_running_loop().create_task(self._run(value))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, value: typing.Any) -> None:
+        try:
+            await self.callback(value)
+        except Exception as e:
+            log.error(f"Coalesced call failed: {e}")
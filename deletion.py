@@ -0,0 +1,114 @@
+import asyncio
+import datetime
+import typing
+import discord
+import log
+
+# Discord refuses to bulk delete messages older than 14 days, keep a margin for the time spent in queue
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14) - datetime.timedelta(minutes=10)
+BULK_DELETE_LIMIT = 100
+
+# Per channel count of deleted and failed messages
+class DeletionReport:
+    def __init__(self):
+        self.channels: dict[int, list[int]] = {}
+
+    def add(self, channel_id: int, deleted: int, failed: int) -> None:
+        counts = self.channels.setdefault(channel_id, [0, 0])
+        counts[0] += deleted
+        counts[1] += failed
+
+    @property
+    def deleted(self) -> int:
+        return sum(counts[0] for counts in self.channels.values())
+
+    @property
+    def failed(self) -> int:
+        return sum(counts[1] for counts in self.channels.values())
+
+    def summary(self, limit: int = 10) -> str:
+        lines = [f"{self.deleted} deleted, {self.failed} failed in {len(self.channels)} channel(s)"]
+        for channel_id, (deleted, failed) in sorted(self.channels.items(), key=lambda item: -sum(item[1]))[:limit]:
+            lines.append(f"- <#{channel_id}>: {deleted} deleted, {failed} failed")
+        if len(self.channels) > limit:
+            lines.append(f"- ... and {len(self.channels) - limit} more channel(s)")
+        return "\n".join(lines)
+
+def _chunks(items: list, size: int) -> typing.Iterator[list]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+# Delete one message by id, without fetching it first. A message already gone counts as deleted
+async def delete_message_by_id(channel, message_id: int) -> bool:
+    try:
+        await channel.get_partial_message(message_id).delete()
+        return True
+    except discord.NotFound:
+        return True
+    except Exception as e:
+        log.error(f"Failed to delete message {message_id} in channel {channel.id}: {e}")
+        return False
+
+# Split the messages of a channel into those which can be bulk deleted and those deleted one by one.
+# `channel` may be a PartialMessageable when the channel is not cached, which can only delete one by one.
+def _split_bulk(channel, message_ids: list[int]) -> tuple[list[int], list[int]]:
+    if not hasattr(channel, "delete_messages"):
+        return [], list(message_ids)
+    bulk_ids: list[int] = []
+    single_ids: list[int] = []
+    limit = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+    for message_id in message_ids:
+        (bulk_ids if discord.utils.snowflake_time(message_id) > limit else single_ids).append(message_id)
+    return bulk_ids, single_ids
+
+# Number of API calls delete_channel_messages needs for these messages (when no bulk delete fails)
+def delete_calls(channel, message_ids: list[int]) -> int:
+    bulk_ids, single_ids = _split_bulk(channel, message_ids)
+    calls = len(single_ids)
+    for chunk in _chunks(bulk_ids, BULK_DELETE_LIMIT):
+        calls += 1 if len(chunk) >= 2 else len(chunk)
+    return calls
+
+# Delete messages of a single channel, through the bulk delete endpoint when they are recent enough.
+# Returns the set of deleted message ids
+async def delete_channel_messages(channel, message_ids: list[int]) -> set[int]:
+    deleted: set[int] = set()
+    bulk_ids, single_ids = _split_bulk(channel, message_ids)
+
+    for chunk in _chunks(bulk_ids, BULK_DELETE_LIMIT):
+        if len(chunk) < 2:
+            single_ids.extend(chunk)
+            continue
+        try:
+            await channel.delete_messages([discord.Object(id=message_id) for message_id in chunk])
+            deleted.update(chunk)
+        except Exception as e:
+            # Missing permission (bots can always delete their own messages one by one) or invalid ids
+            log.error(f"Bulk delete failed in channel {channel.id}, deleting messages one by one: {e}")
+            single_ids.extend(chunk)
+
+    for message_id in single_ids:
+        if await delete_message_by_id(channel, message_id):
+            deleted.add(message_id)
+    return deleted
+
+# Delete messages grouped by channel, with at most `concurrency` channels processed at the same time.
+# `get_channel` resolves a channel id into a channel (or partial messageable) without any API call.
+# Returns the deleted message ids and the per channel report
+async def delete_messages(messages_by_channel: dict[int, list[int]], get_channel: typing.Callable[[int], typing.Any], concurrency: int = 4) -> tuple[set[int], DeletionReport]:
+    report = DeletionReport()
+    deleted: set[int] = set()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def delete_in_channel(channel_id: int, message_ids: list[int]):
+        async with semaphore:
+            try:
+                channel_deleted = await delete_channel_messages(get_channel(channel_id), message_ids)
+            except Exception as e:
+                log.error(f"Failed to delete messages in channel {channel_id}: {e}")
+                channel_deleted = set()
+            deleted.update(channel_deleted)
+            report.add(channel_id, len(channel_deleted), len(message_ids) - len(channel_deleted))
+
+    await asyncio.gather(*(delete_in_channel(channel_id, message_ids) for channel_id, message_ids in messages_by_channel.items()))
+    return deleted, report
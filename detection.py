@@ -0,0 +1,196 @@
+import string
+import typing
+
+DEFAULT_COOLDOWN = 60
+
+# Returns the raw role ids of a member without building the Role objects
+# (`member.roles` resolves and sorts every role of the member on each access)
+def member_role_ids(member) -> typing.Iterable[int]:
+    role_ids = getattr(member, "_roles", None)
+    if role_ids is None:
+        return [role.id for role in member.roles]
+    return role_ids
+
+# Parse an int from a config value (kwargs values are stored as strings)
+def _to_int(value, default: typing.Optional[int] = None) -> typing.Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+# Message template parsed once when the role configuration changes.
+# Templates only support the `{user_id}` field, anything else falls back to str.format.
+# A `<@{user_id}>` mention is recognized so a single message can mention several members.
+class MessageTemplate:
+    __slots__ = ("source", "_chunks", "_error")
+
+    USER_ID = 0
+    MENTION = 1
+
+    def __init__(self, source: str):
+        self.source: str = source or ""
+        self._chunks: typing.Optional[list] = []
+        self._error: typing.Optional[Exception] = None
+        try:
+            for literal, field, spec, conversion in string.Formatter().parse(self.source):
+                if literal:
+                    self._chunks.append(literal)
+                if field is None:
+                    continue
+                if field != "user_id" or spec or conversion:
+                    # Not a simple substitution, let str.format handle it
+                    self._chunks = None
+                    break
+                self._chunks.append(self.USER_ID)
+        except ValueError as e:
+            self._chunks = None
+            self._error = e
+        if self._chunks:
+            self._find_mentions()
+
+    # Turn the `<@` + user_id + `>` chunks into mention fields
+    def _find_mentions(self) -> None:
+        chunks = self._chunks
+        for i, chunk in enumerate(chunks):
+            if isinstance(chunk, str) or chunk != self.USER_ID or i == 0 or i + 1 >= len(chunks):
+                continue
+            before, after = chunks[i - 1], chunks[i + 1]
+            if not isinstance(before, str) or not isinstance(after, str) or not after.startswith(">"):
+                continue
+            prefix = "<@!" if before.endswith("<@!") else "<@" if before.endswith("<@") else None
+            if prefix is None:
+                continue
+            chunks[i - 1] = before[:-len(prefix)]
+            chunks[i] = self.MENTION
+            chunks[i + 1] = after[1:]
+
+    def render(self, user_id: int) -> str:
+        return self.render_many([user_id])
+
+    # Render the message for several members at once: mentions are joined with spaces, raw ids with commas
+    def render_many(self, user_ids: list[int]) -> str:
+        if self._error is not None:
+            raise self._error
+        if self._chunks is None:
+            return "\n".join(self.source.format(user_id=user_id) for user_id in user_ids)
+        ids = ", ".join(str(user_id) for user_id in user_ids)
+        mentions = " ".join(f"<@{user_id}>" for user_id in user_ids)
+        return "".join(chunk if isinstance(chunk, str) else (mentions if chunk == self.MENTION else ids) for chunk in self._chunks)
+
+    def __str__(self) -> str:
+        return self.source
+
+# Role configuration resolved up front for the detection hot path
+class CompiledRole:
+    __slots__ = ("id", "order", "guild_id", "channel_id", "emoji", "cooldown", "template", "config")
+
+    def __init__(self, config: dict, order: int, guild_id: typing.Optional[int] = None):
+        self.id: int = config["id"]
+        self.order: int = order
+        self.guild_id: typing.Optional[int] = guild_id
+        self.channel_id: typing.Optional[int] = _to_int(config.get("channel_notif"))
+        self.emoji: typing.Optional[str] = config.get("emoji") or None
+        self.cooldown: float = float(_to_int(config.get("cooldown"), None) or DEFAULT_COOLDOWN)
+        self.template: MessageTemplate = MessageTemplate(config.get("message"))
+        self.config: dict = config
+
+# Detection index built from the `roles` configuration list.
+# Keeps every configured role by id, and the enabled ones compiled and grouped by guild.
+# `resolve_guild` returns the guild id owning a role id (or None when unknown yet)
+class RoleDetectionIndex:
+    def __init__(self, roles_detection: list, resolve_guild: typing.Callable[[int], typing.Optional[int]]):
+        self.roles_detection: list = roles_detection
+        self.resolve_guild = resolve_guild
+        self.configs: dict[int, dict] = {}
+        self.enabled: dict[int, CompiledRole] = {}
+        self.enabled_ids: frozenset = frozenset()
+        self._by_guild: dict[int, dict[int, CompiledRole]] = {}
+        self._unresolved: dict[int, CompiledRole] = {}
+        self.rebuild()
+
+    def __len__(self) -> int:
+        return len(self.configs)
+
+    # Recompile the whole index from the configuration list
+    def rebuild(self) -> None:
+        self.configs.clear()
+        self.enabled.clear()
+        self._by_guild.clear()
+        self._unresolved.clear()
+        for config in self.roles_detection:
+            self.configs[config["id"]] = config
+            self._compile(config)
+        self.enabled_ids = frozenset(self.enabled)
+
+    # Refresh a single role after its configuration has been changed
+    def update(self, role_id: int) -> None:
+        self._discard(role_id)
+        config = self.configs.get(role_id)
+        if config is not None:
+            self._compile(config)
+        self.enabled_ids = frozenset(self.enabled)
+
+    def add(self, config: dict) -> None:
+        self.roles_detection.append(config)
+        self.configs[config["id"]] = config
+        self.update(config["id"])
+
+    def remove(self, role_id: int) -> typing.Optional[dict]:
+        config = self.configs.pop(role_id, None)
+        if config is not None:
+            self.roles_detection.remove(config)
+        self.update(role_id)
+        return config
+
+    def get_config(self, role_id: int) -> typing.Optional[dict]:
+        return self.configs.get(role_id)
+
+    # Returns the enabled roles held by a member, in configuration order
+    def match(self, guild_id: int, role_ids: typing.Iterable[int]) -> list[CompiledRole]:
+        matched = self.enabled_ids.intersection(role_ids)
+        if not matched:
+            return []
+        compiled_roles = [self.enabled[role_id] for role_id in matched]
+        for compiled in compiled_roles:
+            if compiled.guild_id is None:
+                self._assign_guild(compiled, guild_id)
+        if len(compiled_roles) > 1:
+            compiled_roles.sort(key=lambda compiled: compiled.order)
+        return compiled_roles
+
+    # Returns the enabled roles of a guild, in configuration order
+    def roles_for_guild(self, guild) -> list[CompiledRole]:
+        for compiled in list(self._unresolved.values()):
+            if guild.get_role(compiled.id) is not None:
+                self._assign_guild(compiled, guild.id)
+        compiled_roles = list(self._by_guild.get(guild.id, {}).values())
+        compiled_roles.sort(key=lambda compiled: compiled.order)
+        return compiled_roles
+
+    def _compile(self, config: dict) -> None:
+        if not config.get("enabled"):
+            return
+        order = self.roles_detection.index(config)
+        compiled = CompiledRole(config, order)
+        self.enabled[compiled.id] = compiled
+        guild_id = self.resolve_guild(compiled.id)
+        if guild_id is None:
+            self._unresolved[compiled.id] = compiled
+        else:
+            self._assign_guild(compiled, guild_id)
+
+    def _assign_guild(self, compiled: CompiledRole, guild_id: int) -> None:
+        self._unresolved.pop(compiled.id, None)
+        compiled.guild_id = guild_id
+        self._by_guild.setdefault(guild_id, {})[compiled.id] = compiled
+
+    def _discard(self, role_id: int) -> None:
+        compiled = self.enabled.pop(role_id, None)
+        if compiled is None:
+            return
+        self._unresolved.pop(role_id, None)
+        guild_roles = self._by_guild.get(compiled.guild_id)
+        if guild_roles is not None:
+            guild_roles.pop(role_id, None)
+            if not guild_roles:
+                del self._by_guild[compiled.guild_id]
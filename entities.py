@@ -0,0 +1,128 @@
+import time
+import typing
+import discord
+import log
+
+# Seconds before an id found missing is looked up again
+MISSING_TTL = 600
+
+# Cache of the roles and channels resolved by id.
+# Roles are cached as role id -> guild id (Guild.get_role is a dict lookup), channels as objects
+# since Client.get_channel goes through every guild. Ids which could not be resolved are
+# remembered for MISSING_TTL seconds so they don't trigger a lookup (or a failing API call) each time.
+# The cog invalidates entries from the guild, role and channel events.
+class EntityCache:
+    def __init__(self, bot: discord.Client, missing_ttl: float = MISSING_TTL):
+        self.bot = bot
+        self.missing_ttl: float = missing_ttl
+        self._role_guilds: dict[int, int] = {}
+        self._channels: dict[int, typing.Any] = {}
+        self._missing_roles: dict[int, float] = {}
+        self._missing_channels: dict[int, float] = {}
+
+    def _is_missing(self, missing: dict[int, float], entity_id: int) -> bool:
+        expiry = missing.get(entity_id)
+        if expiry is None:
+            return False
+        if expiry > time.monotonic():
+            return True
+        del missing[entity_id]
+        return False
+
+    def _mark_missing(self, missing: dict[int, float], entity_id: int) -> None:
+        missing[entity_id] = time.monotonic() + self.missing_ttl
+
+    # Returns the id of the guild owning a role, or None when no guild has it
+    def role_guild_id(self, role_id: int) -> typing.Optional[int]:
+        guild_id = self._role_guilds.get(role_id)
+        if guild_id is not None:
+            return guild_id
+        if self._is_missing(self._missing_roles, role_id):
+            return None
+        for guild in self.bot.guilds:
+            if guild.get_role(role_id) is not None:
+                self._role_guilds[role_id] = guild.id
+                return guild.id
+        # Before the bot is ready the guilds are still being received, their roles are not missing
+        if self.bot.is_ready():
+            self._mark_missing(self._missing_roles, role_id)
+        return None
+
+    def get_role(self, role_id: int) -> typing.Optional[discord.Role]:
+        guild_id = self.role_guild_id(role_id)
+        guild = self.bot.get_guild(guild_id) if guild_id is not None else None
+        role = guild.get_role(role_id) if guild is not None else None
+        if role is None and guild_id is not None:
+            # Stale entry, the role or the guild is gone
+            self._role_guilds.pop(role_id, None)
+            self._mark_missing(self._missing_roles, role_id)
+        return role
+
+    # Returns a channel from the client cache, without any API call
+    def get_channel(self, channel_id: int) -> typing.Optional[typing.Any]:
+        channel = self._channels.get(channel_id)
+        if channel is not None:
+            return channel
+        if self._is_missing(self._missing_channels, channel_id):
+            return None
+        channel = self.bot.get_channel(channel_id)
+        if channel is not None:
+            self._channels[channel_id] = channel
+        return channel
+
+    # Returns a channel from the cache, or from the API when not cached
+    async def fetch_channel(self, channel_id: int) -> typing.Optional[typing.Any]:
+        channel = self.get_channel(channel_id)
+        if channel is not None or self._is_missing(self._missing_channels, channel_id):
+            return channel
+        try:
+            channel = await self.bot.fetch_channel(channel_id)
+        except (discord.NotFound, discord.Forbidden) as e:
+            log.error(f"Channel {channel_id} is not available: {e}")
+            self._mark_missing(self._missing_channels, channel_id)
+            return None
+        except Exception as e:
+            log.error(f"Failed to fetch channel {channel_id}: {e}")
+            return None
+        self._channels[channel_id] = channel
+        return channel
+
+    def forget_role(self, role_id: int) -> None:
+        self._role_guilds.pop(role_id, None)
+        self._mark_missing(self._missing_roles, role_id)
+
+    def forget_channel(self, channel_id: int) -> None:
+        self._channels.pop(channel_id, None)
+        self._mark_missing(self._missing_channels, channel_id)
+
+    # Drop everything resolved in a guild (the guild has been left, or its objects replaced)
+    def forget_guild(self, guild_id: int) -> None:
+        for role_id in [role_id for role_id, owner_id in self._role_guilds.items() if owner_id == guild_id]:
+            del self._role_guilds[role_id]
+        for channel_id in [channel_id for channel_id, channel in self._channels.items() if getattr(channel, "guild", None) is not None and channel.guild.id == guild_id]:
+            del self._channels[channel_id]
+
+    # Something new appeared (guild joined, role or channel created): the missing ids may resolve now
+    def clear_missing(self) -> None:
+        self._missing_roles.clear()
+        self._missing_channels.clear()
+
+    # Plain containers handed to the next instance of the cog (hot reload)
+    def export_state(self) -> dict:
+        return {
+            "role_guilds": self._role_guilds,
+            "channels": self._channels,
+            "missing_roles": self._missing_roles,
+            "missing_channels": self._missing_channels,
+        }
+
+    def import_state(self, state: dict) -> None:
+        self._role_guilds = state["role_guilds"]
+        self._channels = state["channels"]
+        self._missing_roles = state["missing_roles"]
+        self._missing_channels = state["missing_channels"]
+
+    def clear(self) -> None:
+        self._role_guilds.clear()
+        self._channels.clear()
+        self.clear_missing()
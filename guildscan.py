@@ -0,0 +1,148 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+import typing
+import log
+
+# Periodic scans scheduled per guild instead of all the guilds at once.
+# Each guild gets its own slot, spread evenly across the interval when the guilds are synced,
+# then runs every `interval` seconds (or its override) plus or minus `jitter` * interval.
+# Scans run in their own tasks, at most `concurrency` at a time, so a slow guild does not
+# delay the others. A guild still being scanned when its slot comes back is skipped once.
+# `prioritize` brings the next scan of a guild forward after some activity.
+class GuildScanScheduler:
+    def __init__(self, scan: typing.Callable[[int], typing.Awaitable[None]], interval: float, overrides: dict[int, float] = None, jitter: float = 0.1, concurrency: int = 2, priority_delay: float = 60.0):
+        self.scan = scan
+        self.interval: float = interval
+        self.overrides: dict[int, float] = overrides if overrides is not None else {}
+        self.jitter: float = jitter
+        self.priority_delay: float = priority_delay
+        self._heap: list[tuple[float, int, int]] = []
+        self._sequence = itertools.count()
+        self._due: dict[int, float] = {}
+        self._running: dict[int, asyncio.Task] = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._task: typing.Optional[asyncio.Task] = None
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, guild_ids: typing.Iterable[int]) -> None:
+        if self.is_running():
+            return
+        self.sync(guild_ids)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in self._running.values():
+            task.cancel()
+        self._running.clear()
+        self._heap.clear()
+        self._due.clear()
+
+    # Next scan time of each guild, handed to the next instance of the cog (hot reload)
+    def export_state(self) -> dict[int, float]:
+        return dict(self._due)
+
+    # Restore the slots of the guilds, before start
+    def import_state(self, state: dict[int, float]) -> None:
+        for guild_id, due in state.items():
+            self._schedule(guild_id, due)
+
+    def interval_for(self, guild_id: int) -> float:
+        return self.overrides.get(guild_id) or self.interval
+
+    # Schedule the guilds not scheduled yet and forget the ones that are gone.
+    # New guilds are spread evenly across their interval.
+    def sync(self, guild_ids: typing.Iterable[int]) -> None:
+        guild_ids = set(guild_ids)
+        for guild_id in [guild_id for guild_id in self._due if guild_id not in guild_ids]:
+            self.remove(guild_id)
+        new_ids = sorted(guild_id for guild_id in guild_ids if guild_id not in self._due)
+        now = time.time()
+        for i, guild_id in enumerate(new_ids):
+            slot = self.interval_for(guild_id) * (i + random.random()) / len(new_ids)
+            self._schedule(guild_id, now + slot)
+
+    def add(self, guild_id: int) -> None:
+        if guild_id not in self._due:
+            self._schedule(guild_id, time.time() + random.uniform(0, self.interval_for(guild_id)))
+
+    def remove(self, guild_id: int) -> None:
+        # The heap entry is dropped lazily
+        self._due.pop(guild_id, None)
+
+    # Scan the guild soon, unless it is already due earlier
+    def prioritize(self, guild_id: int) -> None:
+        due = self._due.get(guild_id)
+        if due is None or guild_id in self._running:
+            return
+        soon = time.time() + self.priority_delay
+        if soon < due:
+            self._schedule(guild_id, soon)
+
+    # Spread every guild again after an interval change
+    def reschedule(self) -> None:
+        now = time.time()
+        for guild_id in list(self._due):
+            self._schedule(guild_id, now + random.uniform(0, self.interval_for(guild_id)))
+
+    # Seconds before the next scan of a guild, None when it is not scheduled
+    def next_scan_in(self, guild_id: int) -> typing.Optional[float]:
+        due = self._due.get(guild_id)
+        return None if due is None else max(0.0, due - time.time())
+
+    def _schedule(self, guild_id: int, due: float) -> None:
+        self._due[guild_id] = due
+        heapq.heappush(self._heap, (due, next(self._sequence), guild_id))
+        if self._heap[0][2] == guild_id:
+            self._wakeup.set()
+
+    def _next_due(self, guild_id: int, start: float) -> float:
+        interval = self.interval_for(guild_id)
+        return start + interval + random.uniform(-self.jitter, self.jitter) * interval
+
+    def _pop_due(self, now: float) -> list[int]:
+        due_ids = []
+        while self._heap and self._heap[0][0] <= now:
+            due, _, guild_id = heapq.heappop(self._heap)
+            # Skip the entries replaced by a later schedule call
+            if self._due.get(guild_id) == due:
+                due_ids.append(guild_id)
+        return due_ids
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            for guild_id in self._pop_due(now):
+                self._schedule(guild_id, self._next_due(guild_id, now))
+                if guild_id in self._running:
+                    log.info(f"Scan of guild {guild_id} still running, skipping this slot")
+                    continue
+                task = asyncio.get_running_loop().create_task(self._scan(guild_id))
+                self._running[guild_id] = task
+
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _scan(self, guild_id: int) -> None:
+        try:
+            async with self._semaphore:
+                await self.scan(guild_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.error(f"Failed to scan guild {guild_id}: {e}")
+        finally:
+            if self._running.get(guild_id) is asyncio.current_task():
+                del self._running[guild_id]
@@ -0,0 +1,231 @@
+import asyncio
+import glob
+import json
+import os
+import threading
+import time
+import typing
+import log
+from .store import TrackedMessage, TrackedMessageStore
+
+JOURNAL_ADD = "+"
+JOURNAL_REMOVE = "-"
+JOURNAL_CLEAR = "c"
+
+# Append-only persistence of the tracked message store.
+# Each mutation of the store appends one small line to the current journal segment.
+# Compaction rotates to a new segment, writes an atomic snapshot referencing it,
+# and deletes the older segments. Loading reads the snapshot and replays the segments after it.
+class TrackedMessageJournal:
+    def __init__(self, store: TrackedMessageStore, directory: str, snapshot_file: str, max_records: int = 10000, max_age: float = 600, fsync: bool = False):
+        self.store: TrackedMessageStore = store
+        self.directory: str = directory
+        self.snapshot_file: str = snapshot_file
+        self.max_records: int = max_records
+        self.max_age: float = max_age
+        self.fsync: bool = fsync
+        self.segment: int = 0
+        self.records: int = 0
+        self.last_compaction: float = time.monotonic()
+        self._file: typing.Optional[typing.TextIO] = None
+        self._compaction: typing.Optional[asyncio.Task] = None
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_segment: int = 0
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.directory, self.snapshot_file)
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{self.snapshot_file}.journal.{segment}")
+
+    def _segments(self) -> list[int]:
+        segments = []
+        prefix = f"{self.snapshot_file}.journal."
+        for path in glob.glob(os.path.join(glob.escape(self.directory), glob.escape(prefix) + "*")):
+            try:
+                segments.append(int(os.path.basename(path)[len(prefix):]))
+            except ValueError:
+                continue
+        return sorted(segments)
+
+    ####                        ####
+    #            Loading           #
+    ####                        ####
+
+    # Restore the store from the snapshot and the journal segments written after it.
+    # Returns the number of replayed journal records
+    def load(self) -> int:
+        os.makedirs(self.directory, exist_ok=True)
+        data = None
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+
+        self.detach()
+        self.store.load_json(data)
+        first_segment = (data or {}).get("journal_segment", 0)
+        segments = self._segments()
+        replayed = 0
+        for segment in segments:
+            if segment >= first_segment:
+                replayed += self._replay(self.segment_path(segment))
+
+        # Never append after a possibly torn line: always start a fresh segment
+        self.segment = max([first_segment - 1] + segments) + 1
+        self._snapshot_segment = first_segment
+        self.records = replayed
+        self._open_segment()
+        self.store.listeners.append(self)
+        return replayed
+
+    def _replay(self, path: str) -> int:
+        count = 0
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    log.error(f"Ignoring corrupted journal record in {path}")
+                    continue
+                op = record[0]
+                if op == JOURNAL_ADD:
+                    self.store.add(TrackedMessage.from_row(record[1:]))
+                elif op == JOURNAL_REMOVE:
+                    self.store.remove(record[1], record[2], record[3])
+                elif op == JOURNAL_CLEAR:
+                    self.store.clear()
+                count += 1
+        return count
+
+    ####                        ####
+    #          Appending           #
+    ####                        ####
+
+    def _open_segment(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.segment_path(self.segment), "a", encoding="utf-8")
+
+    def _append(self, record: list) -> None:
+        if self._file is None:
+            return
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.records += 1
+        self.maybe_compact()
+
+    # Store listener callbacks
+    def on_add(self, entry: TrackedMessage) -> None:
+        self._append([JOURNAL_ADD] + entry.to_row())
+
+    def on_remove(self, entry: TrackedMessage) -> None:
+        self._append([JOURNAL_REMOVE, entry.guild_id, entry.member_id, entry.role_id])
+
+    def on_clear(self) -> None:
+        self._append([JOURNAL_CLEAR])
+
+    ####                        ####
+    #          Hot reload          #
+    ####                        ####
+
+    def export_state(self) -> dict:
+        return {
+            "segment": self.segment,
+            "snapshot_segment": self._snapshot_segment,
+            "records": self.records,
+            "last_compaction": self.last_compaction,
+        }
+
+    # Continue the journal of a previous instance whose store has been adopted as is:
+    # nothing is read from the disk, appends go to a fresh segment
+    def resume(self, state: dict) -> None:
+        self.detach()
+        self.segment = state["segment"] + 1
+        self._snapshot_segment = state["snapshot_segment"]
+        self.records = state["records"]
+        self.last_compaction = state["last_compaction"]
+        os.makedirs(self.directory, exist_ok=True)
+        self._open_segment()
+        self.store.listeners.append(self)
+
+    # Wait for a running background compaction
+    async def wait_compaction(self) -> None:
+        if self._compaction is not None and not self._compaction.done():
+            await asyncio.gather(self._compaction, return_exceptions=True)
+
+    def detach(self) -> None:
+        if self in self.store.listeners:
+            self.store.listeners.remove(self)
+
+    def close(self) -> None:
+        self.detach()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    ####                        ####
+    #          Compaction          #
+    ####                        ####
+
+    def should_compact(self) -> bool:
+        if self.records == 0:
+            return False
+        return self.records >= self.max_records or time.monotonic() - self.last_compaction >= self.max_age
+
+    # Start a background compaction when a threshold is reached
+    def maybe_compact(self) -> None:
+        if self._compaction is not None and not self._compaction.done():
+            return
+        if not self.should_compact():
+            return
+        try:
+            self._compaction = asyncio.get_running_loop().create_task(self._background_compact())
+        except RuntimeError:
+            # No running loop (e.g. replaying at startup), compaction will happen later
+            pass
+
+    # Switch appends to a new segment and capture the entries to snapshot.
+    # Records are never mutated, so the snapshot rows can be built outside of the event loop.
+    # Mutations done after the rotation are written in the new segment and replayed over the snapshot.
+    def _rotate(self) -> tuple[int, list[TrackedMessage]]:
+        self.segment += 1
+        self._open_segment()
+        self.records = 0
+        self.last_compaction = time.monotonic()
+        return self.segment, list(self.store)
+
+    def _write_snapshot(self, segment: int, entries: list[TrackedMessage]) -> None:
+        with self._snapshot_lock:
+            # A more recent snapshot may have been written meanwhile
+            if segment <= self._snapshot_segment:
+                return
+            self._write_snapshot_locked(segment, entries)
+            self._snapshot_segment = segment
+
+    def _write_snapshot_locked(self, segment: int, entries: list[TrackedMessage]) -> None:
+        data = self.store.to_json(entries)
+        data["journal_segment"] = segment
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file, separators=(",", ":"))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        for old_segment in self._segments():
+            if old_segment < segment:
+                os.remove(self.segment_path(old_segment))
+
+    # Compact the journal, the snapshot is serialized and written in a worker thread
+    async def compact(self) -> None:
+        segment, entries = self._rotate()
+        await asyncio.to_thread(self._write_snapshot, segment, entries)
+        log.info(f"Tracked messages compacted to {self.snapshot_path}: {len(entries)} entries")
+
+    async def _background_compact(self) -> None:
+        try:
+            await self.compact()
+        except Exception as e:
+            log.error(f"Failed to compact tracked messages journal: {e}")
@@ -0,0 +1,26 @@
+# Listings are split in pages of PAGE_SIZE entries, each line short enough to fit
+# a page in a single Discord message (2000 characters max)
+PAGE_SIZE = 10
+NAME_MAX_LENGTH = 32
+MESSAGE_MAX_LENGTH = 2000
+
+def shorten(text, width: int = NAME_MAX_LENGTH) -> str:
+    text = str(text)
+    return text if len(text) <= width else text[:width - 1] + "…"
+
+def page_count(count: int, page_size: int = PAGE_SIZE) -> int:
+    return max(1, (count + page_size - 1) // page_size)
+
+def format_age(seconds: float) -> str:
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return f"{minutes}m"
+    hours, minutes = divmod(minutes, 60)
+    if hours < 24:
+        return f"{hours}h{minutes:02d}"
+    days, hours = divmod(hours, 24)
+    return f"{days}d{hours:02d}h"
+
+# Short duration, in seconds under a minute
+def format_duration(seconds: float) -> str:
+    return f"{int(seconds)}s" if seconds < 60 else format_age(seconds)
@@ -1,15 +1,43 @@
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 import asyncio
-import datetime
+import atexit
+import collections
+import copy
+import functools
 import time
 import typing
 import json
 import os
+import sys
 import log
 import filehelper
 import predicate
 import kwargparse
+from .detection import CompiledRole, MessageTemplate, RoleDetectionIndex, member_role_ids
+from .store import TrackedMessage, TrackedMessageStore
+from .journal import TrackedMessageJournal
+from .pipeline import CompletionWatermark, SendJob, SendPipeline, rate_limit_retry_after
+from .roster import RoleMembershipSnapshot
+from .scheduler import CooldownScheduler
+from .deletion import DeletionReport, delete_messages
+from .batching import NotificationBatcher
+from .coalescer import Coalescer
+from .entities import EntityCache
+from .guildscan import GuildScanScheduler
+from .reconciler import QUERY_MEMBERS_MAX, TrackedMessageReconciler
+from .workqueue import MemberWorkQueue, WorkItem
+from .listing import MESSAGE_MAX_LENGTH, PAGE_SIZE, format_age, format_duration, page_count, shorten
+from .metrics import Metrics, PrometheusFileWriter
+from .cluster import ClusterCoordinator, ShardPartition, partition_file
+from .planner import RESEND, SEND, SKIP, PlannedOperation, ScanPlan
+
+SCAN_CHECKPOINT_INTERVAL = 1000
+# Bot attribute holding the live state between the old and the new cog of a hot reload
+HANDOFF_ATTRIBUTE = "_bam_handoff"
+HANDOFF_VERSION = 1
+# Seconds for a new cog to claim the state before it is saved (extension unloaded without reload)
+HANDOFF_TIMEOUT = 30
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(BAM(bot))
@@ -17,68 +45,391 @@ async def setup(bot: commands.Bot):
 
 async def teardown(bot: commands.Bot):
     await bot.remove_cog("BAM")
+    # discord.py only forgets the submodules of this module,
+    # forget the sibling modules too so a reload runs their latest code
+    for name in [name for name in sys.modules if name.startswith(f"{__package__}.") and name != __name__]:
+        del sys.modules[name]
     log.info("BAM extension unloaded")
 
 class BAM(commands.Cog):
     def __init__(self, bot):
         log.info("BAM Cog initialize...")
         self.bot: commands.Bot = bot
-        self.msg_tracked: dict[str, any] = {}
+        self.msg_tracked = TrackedMessageStore()
         self.config = filehelper.openConfig('bam')
+        # Per event logs (messages, member updates, scanned members) are only written when enabled
+        self.verbose_logging: bool = self.config.get("verbose_logging") or False
         self.roles_detection: list = self.config.get("roles") or list()
+        # Roles and channels resolved by id, invalidated by the guild events
+        self.entities = EntityCache(self.bot)
+        self.role_index = RoleDetectionIndex(self.roles_detection, self.resolve_role_guild)
+        # Shard-aware operation: each process only scans and stores the guilds of its shards, in its own save files
+        cluster_config: dict = self.config.get("cluster") or {}
+        self.partition = ShardPartition.from_bot(self.bot, cluster_config)
         self.periodic_scan_enabled = self.config.get("periodic_scan_enabled") or False
-        self.periodic_scan.change_interval(minutes=self.config.get("periodic_scan_interval") or 60)
+        # Periodic scans are staggered per guild, `periodic_scan_guild_intervals` overrides the interval (in minutes) of some guilds
+        scan_overrides = self.config.get("periodic_scan_guild_intervals") or {}
+        self.scan_scheduler = GuildScanScheduler(
+            self.periodic_scan,
+            interval=(self.config.get("periodic_scan_interval") or 60) * 60,
+            overrides={int(guild_id): minutes * 60 for guild_id, minutes in scan_overrides.items()},
+            jitter=self.config.get("periodic_scan_jitter") or 0.1,
+            concurrency=self.config.get("periodic_scan_concurrency") or max(2, len(self.partition.shard_ids or ())),
+            priority_delay=self.config.get("periodic_scan_priority_delay") or 60,
+        )
+        # "cache" scans use the member cache (role.members), "stream" scans page through guild.fetch_members
+        self.scan_mode: str = self.config.get("scan_mode") or "cache"
+        self.scan_checkpoints: dict[int, int] = {}
+        self.scan_checkpoints_save_file = partition_file("scan_checkpoints.bam.json", self.partition.cluster_id)
+        self.scan_checkpoints_lock = asyncio.Lock()
+        # Members of the running stream scans whose sends are all done, per (job, guild)
+        self.stream_watermarks: dict[tuple[SendJob, int], CompletionWatermark] = {}
+        # Command tasks running in background (e.g. tracked messages checks), cancelled on unload
+        self.background_tasks: set[asyncio.Task] = set()
+        # Periodic scans only process the role membership changes since the previous tick,
+        # with a full scan every `full_scan_every` ticks to catch up with missed events
+        self.role_snapshots = RoleMembershipSnapshot()
+        self.member_update_parser: typing.Optional[typing.Callable] = None
+        self.full_scan_every: int = self.config.get("full_scan_every") or 24
+        self.delta_ticks: dict[int, int] = {}
+        # Resends the tracked messages when their role cooldown expires, while the periodic scan is enabled
+        self.cooldown_scheduler = CooldownScheduler(self.msg_tracked, self.cooldown_due_time, self.resend_expired)
         self.tracked_msg_save_file = "tracked_messages.bam.json"
         try:
             self.tracked_msg_save_file = self.config["save_path"]["tracked_messages"]
         except:
             pass
+        # Save file of a single process setup, split between the processes on their first start
+        self.shared_save_file = self.tracked_msg_save_file
+        self.tracked_msg_save_file = partition_file(self.tracked_msg_save_file, self.partition.cluster_id)
+        # Journaled persistence: every tracked message change is appended to a journal
+        # and periodically compacted into the save file
+        journal_config: dict = self.config.get("journal") or {}
+        self.journal: typing.Optional[TrackedMessageJournal] = None
+        if journal_config.get("enabled", True):
+            self.journal = TrackedMessageJournal(
+                self.msg_tracked, "save", self.tracked_msg_save_file,
+                max_records=journal_config.get("max_records") or 10000,
+                max_age=(journal_config.get("max_age") or 10) * 60,
+                fsync=journal_config.get("fsync") or False,
+            )
+        # Member updates adding a tracked role are evaluated once per member per `member_update_window` seconds
+        self.member_updates = Coalescer(self.evaluate_member_update, self.config.get("member_update_window") or 2.0)
+        # Listeners only queue work, deduplicated per member, and a fixed pool of consumers does the API calls
+        work_queue_config: dict = self.config.get("work_queue") or {}
+        self.work_queue = MemberWorkQueue(
+            self.process_work_item,
+            consumers=work_queue_config.get("consumers") or 4,
+            max_depth=work_queue_config.get("max_depth") or 10000,
+            policy=work_queue_config.get("policy") or "drop_new",
+            max_reactions=work_queue_config.get("max_reactions") or 3,
+        )
+        # Batching mode: one message per member and channel for all their roles,
+        # and scans mention up to `batch_max_mentions` members per message
+        self.batch_notifications: bool = self.config.get("batch_notifications") or False
+        self.batch_max_mentions: int = self.config.get("batch_max_mentions") or 20
+        self.job_batchers: dict[SendJob, NotificationBatcher] = {}
+        # Last dry run of `scan plan`, executed by `scan plan run`
+        self.scan_plan: typing.Optional[ScanPlan] = None
+        # Number of channels in which messages are deleted at the same time
+        self.deletion_concurrency: int = self.config.get("deletion_concurrency") or 4
+        # Rate limited sending used by scans
+        pipeline_config: dict = self.config.get("send_pipeline") or {}
+        self.pipeline = SendPipeline(
+            workers=pipeline_config.get("workers") or 4,
+            queue_size=pipeline_config.get("queue_size") or 1000,
+            channel_rate=pipeline_config.get("channel_rate") or 1.0,
+            channel_burst=pipeline_config.get("channel_burst") or 5,
+            guild_rate=pipeline_config.get("guild_rate") or 5.0,
+            guild_burst=pipeline_config.get("guild_burst") or 10,
+            max_retries=pipeline_config.get("max_retries") or 3,
+            on_give_up=lambda: self.metrics.inc("bam_sends_total", labels='result="failed"'),
+        )
+        # Background pruning of the tracked messages which no longer exist, within an API budget
+        reconciler_config: dict = self.config.get("reconciler") or {}
+        self.reconciler_enabled: bool = reconciler_config.get("enabled", True)
+        self.reconciler = TrackedMessageReconciler(
+            self.bot,
+            self.msg_tracked,
+            self.entities.get_channel,
+            self.delete_tracked_messages,
+            budget=reconciler_config.get("budget_per_minute") or 30,
+            batch_size=reconciler_config.get("batch_size") or 100,
+            interval=(reconciler_config.get("interval") or 60) * 60,
+        )
+        # Cluster-wide `scan all` and `showTrackedMessages` through a SQLite file shared by the processes
+        self.coordinator: typing.Optional[ClusterCoordinator] = None
+        self.cluster_request_timeout: float = (cluster_config.get("request_timeout") or 60) * 60
+        if cluster_config.get("coordinator"):
+            self.coordinator = ClusterCoordinator(
+                cluster_config["coordinator"],
+                self.partition,
+                self.msg_tracked,
+                self.handle_cluster_request,
+                poll_interval=cluster_config.get("poll_interval") or 5,
+                publish_interval=cluster_config.get("publish_interval") or 300,
+            )
+        # Counters and latency histograms, shown by `bam stats` and optionally written to a Prometheus text file
+        self.metrics = Metrics()
+        self.scan_durations: dict[int, float] = {}
+        self.register_metrics()
+        metrics_config: dict = self.config.get("metrics") or {}
+        self.metrics_writer: typing.Optional[PrometheusFileWriter] = None
+        if metrics_config.get("prometheus_file"):
+            self.metrics_writer = PrometheusFileWriter(self.metrics, metrics_config["prometheus_file"], interval=metrics_config.get("interval") or 15)
+
+    # Gauges are read from the live state when rendering, they cost nothing on the hot paths
+    def register_metrics(self):
+        self.metrics.describe("bam_events_total", "Gateway events processed")
+        self.metrics.describe("bam_role_matches_total", "Events of members holding a tracked role")
+        self.metrics.describe("bam_sends_total", "Role messages sent, skipped by their cooldown, or failed")
+        self.metrics.describe("bam_deletes_total", "Tracked messages deleted or failed to delete")
+        self.metrics.describe("bam_api_errors_total", "Discord API errors, rate limits included")
+        self.metrics.describe("bam_send_seconds", "Latency of the role message sends")
+        self.metrics.describe("bam_work_item_seconds", "Time to process a queued member")
+        self.metrics.describe("bam_scan_seconds", "Duration of the scans")
+        self.metrics.gauge("bam_tracked_messages", lambda: len(self.msg_tracked), "Tracked messages in the store")
+        self.metrics.gauge("bam_roster_members", self.role_snapshots.member_count, "Members in the tracked roles roster")
+        self.metrics.gauge("bam_roster_bytes", self.role_snapshots.nbytes, "Memory used by the roster member ids")
+        self.metrics.gauge("bam_work_queue_depth", lambda: len(self.work_queue), "Members waiting in the work queue")
+        self.metrics.gauge("bam_work_queue_dropped", lambda: self.work_queue.dropped, "Members dropped by the full work queue")
+        self.metrics.gauge("bam_work_queue_merged", lambda: self.work_queue.merged, "Events merged with a member already queued")
+        self.metrics.gauge("bam_send_queue_depth", lambda: self.pipeline.queue.qsize(), "Messages waiting in the send pipeline")
+        self.metrics.gauge("bam_reconciler_pruned", lambda: self.reconciler.pruned, "Tracked messages pruned by the reconciler")
+        self.metrics.gauge("bam_last_scan_seconds", lambda: {f'guild="{guild_id}"': duration for guild_id, duration in self.scan_durations.items()}, "Duration of the last scan of each guild")
 
-    def load_tracked_messages(self):
+    # File reads and JSON parsing run in a worker thread to not block the event loop.
+    # Only called from cog_load, before any listener can mutate the store.
+    async def load_tracked_messages(self):
         # Create the directory if it doesn't exist
-        filehelper.ensure_directory("save")
-        self.msg_tracked = filehelper.openJson("save", self.tracked_msg_save_file) or {}
-        log.info(f"Tracked messages loaded from {self.tracked_msg_save_file}: {self.msg_tracked}")
+        await asyncio.to_thread(filehelper.ensure_directory, "save")
+        if self.journal is not None:
+            replayed = await asyncio.to_thread(self.journal.load)
+            log.info(f"Tracked messages loaded from {self.tracked_msg_save_file}: {len(self.msg_tracked)} entries ({replayed} journal records replayed)")
+            return
+        data = await asyncio.to_thread(filehelper.openJson, "save", self.tracked_msg_save_file)
+        count = await asyncio.to_thread(self.msg_tracked.load_json, data)
+        log.info(f"Tracked messages loaded from {self.tracked_msg_save_file}: {count} entries")
 
-    def save_tracked_messages(self):
-        filehelper.saveJson("save", self.tracked_msg_save_file, self.msg_tracked)
-        log.info(f"Tracked messages saved to {self.tracked_msg_save_file}: {self.msg_tracked}")
+    # Last member id submitted by an interrupted stream scan, per guild
+    async def load_scan_checkpoints(self):
+        data = await asyncio.to_thread(filehelper.openJson, "save", self.scan_checkpoints_save_file) or {}
+        self.scan_checkpoints = {int(guild_id): int(member_id) for guild_id, member_id in data.items()}
 
-    @tasks.loop(seconds=10)
-    async def periodic_scan(self):
-        try:
-            log.info("Executing periodic scan...")
-            await self.fetch_roles()
-        except Exception as e:
-            log.error(f"Failed to execute periodic scan: {e}")
+    # Guilds are scanned concurrently, one write at a time
+    async def save_scan_checkpoints(self):
+        async with self.scan_checkpoints_lock:
+            data = {str(guild_id): member_id for guild_id, member_id in self.scan_checkpoints.items()}
+            await asyncio.to_thread(filehelper.saveJson, "save", self.scan_checkpoints_save_file, data)
+
+    # First start of a partitioned process: take the tracked messages of its guilds from the save file
+    # of the single process setup. Every process reads it, the file itself is left untouched.
+    async def migrate_shared_store(self):
+        if self.shared_save_file == self.tracked_msg_save_file or len(self.msg_tracked) > 0:
+            return
+        if await asyncio.to_thread(os.path.exists, os.path.join("save", self.tracked_msg_save_file)):
+            return
+        data = await asyncio.to_thread(filehelper.openJson, "save", self.shared_save_file)
+        if not data:
+            return
+        shared = TrackedMessageStore()
+        await asyncio.to_thread(shared.load_json, data)
+        for msgData in shared:
+            if self.partition.owns(msgData.guild_id):
+                self.msg_tracked.add(msgData)
+        log.info(f"Tracked messages migrated from {self.shared_save_file}: {len(self.msg_tracked)} of {len(shared)} entries")
+        if self.journal is None:
+            await self.save_tracked_messages()
+
+    # Forget the tracked messages of the guilds of other shards (e.g. after the shards have been redistributed)
+    def drop_foreign_entries(self):
+        foreign = [msgData for guild_id in self.msg_tracked.guilds() if not self.partition.owns(guild_id) for msgData in self.msg_tracked.for_guild(guild_id)]
+        for msgData in foreign:
+            self.msg_tracked.discard(msgData)
+        if foreign:
+            log.info(f"Dropped {len(foreign)} tracked messages of guilds not owned by this process ({self.partition.describe()})")
+
+    # Serialize a snapshot of the tracked messages in a worker thread
+    async def save_tracked_messages(self):
+        if self.journal is not None:
+            await self.journal.compact()
+        else:
+            entries = list(self.msg_tracked)
+            await asyncio.to_thread(self._save_tracked_entries, entries)
+        log.info(f"Tracked messages saved to {self.tracked_msg_save_file}: {len(self.msg_tracked)} entries")
+
+    def _save_tracked_entries(self, entries: list[TrackedMessage]):
+        filehelper.saveJson("save", self.tracked_msg_save_file, self.msg_tracked.to_json(entries))
+
+    # Save a copy of the config in a worker thread
+    async def save_config(self):
+        self.config["roles"] = self.roles_detection
+        data = copy.deepcopy(self.config)
+        await asyncio.to_thread(filehelper.saveConfig, module="bam", data=data)
+
+    # Called by the scan scheduler in the slot of each guild
+    async def periodic_scan(self, guild_id: int):
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            self.scan_scheduler.remove(guild_id)
+            return
+        log.info(f"Executing periodic scan of {guild.name} ({guild.id})...")
+        await self.fetch_roles(guild, resume=True, delta=True)
 
     def start_periodic_scan(self):
         if self.periodic_scan_enabled:
             log.info("Starting perdiodic scan...")
-            self.periodic_scan.start()
+            self.scan_scheduler.start(guild.id for guild in self.bot.guilds)
+            self.cooldown_scheduler.start()
 
     def stop_periodic_scan(self):
-        if self.periodic_scan.is_running():
+        if self.scan_scheduler.is_running():
             log.info("Cancelling perdiodic scan...")
-            self.periodic_scan.cancel()
+            self.scan_scheduler.stop()
+        self.cooldown_scheduler.stop()
 
     # Cog startup
     async def cog_load(self):
         log.info("BAM module startup!")
-        self.load_tracked_messages()
+        if not self.claim_handoff():
+            await self.load_tracked_messages()
+            await self.load_scan_checkpoints()
+            await self.migrate_shared_store()
+        self.drop_foreign_entries()
+        self.pipeline.start()
+        self.work_queue.start()
+        self.hook_member_updates()
         self.start_periodic_scan()
+        if self.reconciler_enabled:
+            self.reconciler.start()
+        if self.metrics_writer is not None:
+            self.metrics_writer.start()
+        if self.coordinator is not None:
+            try:
+                await self.coordinator.start()
+            except Exception as e:
+                log.error(f"Failed to join the cluster: {e}")
     
     # Cog cleanup
     async def cog_unload(self):
         log.info("BAM module cleanup!")
+        self.unhook_member_updates()
+        # The schedulers forget everything when stopped
+        cooldowns = self.cooldown_scheduler.export_state()
+        scan_slots = self.scan_scheduler.export_state()
         self.stop_periodic_scan()
-        self.save_tracked_messages()
-        self.config["roles"] = self.roles_detection
-        filehelper.saveConfig(module="bam", data=self.config)
+        self.reconciler.stop()
+        if self.metrics_writer is not None:
+            self.metrics_writer.stop()
+        if self.coordinator is not None and self.coordinator.is_running():
+            self.coordinator.stop()
+            try:
+                await self.coordinator.leave()
+            except Exception as e:
+                log.error(f"Failed to leave the cluster: {e}")
+        for task in self.background_tasks:
+            task.cancel()
+        self.member_updates.cancel()
+        self.work_queue.stop()
+        await self.pipeline.stop()
+        if self.journal is not None:
+            # Every change is already in the journal, no need to compact it
+            await self.journal.wait_compaction()
+            self.journal.close()
+        await self.save_config()
+        self.hand_off(cooldowns, scan_slots)
+
+    ####                              ####
+    #             Hot reload             #
+    ####                              ####
+
+    # Leave the live state on the bot for the cog of the reloaded extension, instead of saving and
+    # parsing it again. The tracked messages are saved if no new cog claims the state within
+    # HANDOFF_TIMEOUT seconds or before exiting (unload, shutdown). With the journal enabled
+    # the save file is already up to date, so there is nothing to save.
+    def hand_off(self, cooldowns: typing.Optional[dict], scan_slots: dict[int, float]):
+        state = {
+            "version": HANDOFF_VERSION,
+            "store": self.msg_tracked.export_state(),
+            "roster": self.role_snapshots.export_state(),
+            "entities": self.entities.export_state(),
+            "cooldowns": cooldowns,
+            "scan_slots": scan_slots,
+            "scan_checkpoints": self.scan_checkpoints,
+            "delta_ticks": self.delta_ticks,
+            "journal": self.journal.export_state() if self.journal is not None else None,
+        }
+        saved = self.journal is not None
+        entries = list(self.msg_tracked) if not saved else []
+
+        def persist():
+            nonlocal saved
+            if saved:
+                return
+            saved = True
+            atexit.unregister(persist)
+            self._save_tracked_entries(entries)
+            log.info(f"Unclaimed tracked messages saved to {self.tracked_msg_save_file}: {len(entries)} entries")
+
+        def expire():
+            if getattr(self.bot, HANDOFF_ATTRIBUTE, None) is state:
+                delattr(self.bot, HANDOFF_ATTRIBUTE)
+                asyncio.get_running_loop().create_task(asyncio.to_thread(persist))
+
+        timer = asyncio.get_running_loop().call_later(HANDOFF_TIMEOUT, expire)
+        atexit.register(persist)
+
+        def release():
+            nonlocal saved
+            saved = True
+            timer.cancel()
+            atexit.unregister(persist)
+
+        state["persist"] = persist
+        state["release"] = release
+        setattr(self.bot, HANDOFF_ATTRIBUTE, state)
+        log.info(f"State handed off: {len(self.msg_tracked)} tracked messages")
+
+    # Adopt the state handed off by the previous cog, returns False if there is none.
+    # Containers are adopted as is, so this does not depend on the size of the state.
+    def claim_handoff(self) -> bool:
+        state = getattr(self.bot, HANDOFF_ATTRIBUTE, None)
+        if state is None:
+            return False
+        delattr(self.bot, HANDOFF_ATTRIBUTE)
+        if state.get("version") != HANDOFF_VERSION:
+            state["persist"]()
+            return False
+        try:
+            self.msg_tracked.import_state(state["store"])
+            self.role_snapshots.import_state(state["roster"])
+            self.entities.import_state(state["entities"])
+            self.scan_checkpoints = state["scan_checkpoints"]
+            self.delta_ticks = state["delta_ticks"]
+            if self.journal is not None:
+                if state["journal"] is None:
+                    # The journal has just been enabled: save the snapshot it starts from
+                    state["persist"]()
+                self.journal.resume(state["journal"] or {"segment": 0, "snapshot_segment": 0, "records": 0, "last_compaction": time.monotonic()})
+        except Exception as e:
+            log.error(f"Failed to adopt the handed off state, loading from disk: {e}")
+            # Make sure the state of the previous cog is on disk before loading it
+            state["persist"]()
+            self.msg_tracked.import_state(TrackedMessageStore().export_state())
+            self.role_snapshots = RoleMembershipSnapshot()
+            self.entities.clear()
+            return False
+        if self.periodic_scan_enabled:
+            self.cooldown_scheduler.import_state(state["cooldowns"])
+            self.scan_scheduler.import_state(state["scan_slots"])
+        state["release"]()
+        self.role_index.rebuild()
+        log.info(f"State claimed: {len(self.msg_tracked)} tracked messages")
+        return True
 
     # Try to retrieve a message from a channel
     async def get_message(self, channel_id: int, message_id: int) -> typing.Optional[discord.Message]:
-        channel = self.bot.get_channel(channel_id)
+        channel = self.entities.get_channel(channel_id)
         if channel is None:
             log.error(f"Channel not found: {channel_id}")
             return None
@@ -97,130 +448,391 @@ class BAM(commands.Cog):
         return message
 
     # Send a message in a channel and track this message for later deletion
-    # returns True when the message has been sent, false otherwise
-    async def send_role_message(self, role_id: int, guild: discord.Guild, member: discord.Member, channel: discord.TextChannel, message: str, resend: bool = False, forceResendDelay: int = 60, replyParent: discord.Message = None) -> bool:
+    # returns True when the message has been sent, False when it is not needed (cooldown) and None when sending failed
+    # raiseRateLimit lets rate limit errors propagate to the caller (e.g. the send pipeline)
+    async def send_role_message(self, role_id: int, guild: discord.Guild, member: discord.Member, channel: discord.TextChannel, message: MessageTemplate, resend: bool = False, forceResendDelay: int = 60, replyParent: discord.Message = None, raiseRateLimit: bool = False) -> typing.Optional[bool]:
         try:
-            key = f"{guild.id}-{member.id}"
-
             # Check if a message has already been sent to this user
-            msgDataList = self.msg_tracked.get(key)
-            if msgDataList is not None:
-                msgData = None
-                for msgDatum in msgDataList:
-                    if msgDatum["role"] == role_id:
-                        msgData = msgDatum
-                        break
-                
+            msgData = self.msg_tracked.get(guild.id, member.id, role_id)
+            if msgData is not None:
                 try:
-                    elapsed_minutes = (datetime.datetime.fromtimestamp(time.time()) - datetime.datetime.fromtimestamp(msgData["timestamp"])).total_seconds() / 60
-                    log.info(f"Message already sent to {member.name} ({member.id}) in {guild.name} ({guild.id}), (elapsed minutes since last message: {elapsed_minutes}).")
+                    elapsed_minutes = (time.time() - msgData.timestamp) / 60
+                    if self.verbose_logging:
+                        log.info(f"Message already sent to {member.name} ({member.id}) in {guild.name} ({guild.id}), (elapsed minutes since last message: {elapsed_minutes}).")
                     if elapsed_minutes > forceResendDelay:
                         resend = True
-                        log.info(f"Forcing resend (>{forceResendDelay} minutes).")
-                    else:
+                        if self.verbose_logging:
+                            log.info(f"Forcing resend (>{forceResendDelay} minutes).")
+                    elif self.verbose_logging:
                         log.info(f"Not resending message (<{forceResendDelay} minutes).")
                 except Exception as e:
                     log.error(f"Failed to retrieve tracked message timestamp: {e}")
                     
                 if not resend:
                     # Do not send message if already sent
+                    self.metrics.inc("bam_sends_total", labels='result="cooldown"')
                     return False
                 else:
                     # Delete previous message if resend is True
-                    await self.delete_role_message(key)
+                    await self.delete_role_message(guild.id, member.id, role_id)
 
+            content = message.render(user_id=member.id)
+            started = time.perf_counter()
             if replyParent is None:
-                msg = await channel.send(message.format(user_id=member.id))
+                msg = await channel.send(content)
             else:
-                msg = await replyParent.reply(message.format(user_id=member.id), mention_author=True)
-            if self.msg_tracked.get(key) is None:
-                self.msg_tracked[key] = []
-
-            self.msg_tracked[key].append({"role": role_id, "guild": msg.guild.id, "channel": msg.channel.id, "id": msg.id, "timestamp": msg.created_at.timestamp()});
+                msg = await replyParent.reply(content, mention_author=True)
+            self.record_send(started)
+            self.msg_tracked.add(TrackedMessage(msg.guild.id, member.id, role_id, msg.channel.id, msg.id, msg.created_at.timestamp()))
         
-            log.info(f"Message tracked: {key}")
+            if self.verbose_logging:
+                log.info(f"Message tracked: {guild.id}-{member.id} (role {role_id})")
             return True
         except Exception as e:
+            retried = raiseRateLimit and rate_limit_retry_after(e) is not None
+            self.record_send_error(e, failed=not retried)
+            if retried:
+                raise
             log.error(f"Failed to send message: {e}")
-        return False
+        return None
 
-    async def delete_role_message(self, key: str):
-        for msgData in self.msg_tracked.get(key):
-            try:
-                msg = await self.get_message(msgData["channel"], msgData["id"])
-                await msg.delete()
-                del self.msg_tracked[key]
-                log.info(f"Message untracked {key}")
-            except Exception as e:
-                log.error(f"Failed to delete message: {e}")
+    def record_send(self, started: float):
+        self.metrics.observe("bam_send_seconds", time.perf_counter() - started)
+        self.metrics.inc("bam_sends_total", labels='result="sent"')
+
+    # `failed` is False when the send is retried (the pipeline counts it as failed if it gives up)
+    def record_send_error(self, error: Exception, failed: bool = True):
+        if failed:
+            self.metrics.inc("bam_sends_total", labels='result="failed"')
+        if rate_limit_retry_after(error) is not None:
+            self.metrics.inc("bam_api_errors_total", labels='kind="rate_limited"')
+        elif isinstance(error, discord.HTTPException):
+            self.metrics.inc("bam_api_errors_total", labels='kind="http"')
+
+    # Delete the tracked message of a member for a role, or all of them if no role is given
+    async def delete_role_message(self, guild_id: int, member_id: int, role_id: int = None):
+        if role_id is None:
+            msgDataList = self.msg_tracked.for_member(guild_id, member_id)
+        else:
+            msgData = self.msg_tracked.get(guild_id, member_id, role_id)
+            msgDataList = [msgData] if msgData is not None else []
+
+        if not msgDataList:
+            return
+        report = await self.delete_tracked_messages(msgDataList)
+        if self.verbose_logging:
+            log.info(f"Messages untracked {guild_id}-{member_id}: {report.deleted} deleted, {report.failed} failed")
+
+    # Resolve a channel to delete messages in, without any API call
+    def get_messageable(self, channel_id: int):
+        return self.entities.get_channel(channel_id) or self.bot.get_partial_messageable(channel_id)
+
+    # Delete tracked messages by id (no fetch), grouped by channel and bulk deleted when possible.
+    # Deleted messages (or already gone) are untracked, the others are kept.
+    # Messages shared with other tracked entries (batching mode) are only untracked.
+    async def delete_tracked_messages(self, msgDataList: list[TrackedMessage]) -> DeletionReport:
+        removed_refs = collections.Counter(msgData.message_id for msgData in msgDataList)
+        messages_by_channel: dict[int, set[int]] = {}
+        shared: set[int] = set()
+        for msgData in msgDataList:
+            if self.msg_tracked.message_refs(msgData.message_id) > removed_refs[msgData.message_id]:
+                shared.add(msgData.message_id)
+            else:
+                messages_by_channel.setdefault(msgData.channel_id, set()).add(msgData.message_id)
+
+        deleted, report = await delete_messages({channel_id: list(message_ids) for channel_id, message_ids in messages_by_channel.items()}, self.get_messageable, self.deletion_concurrency)
+        for msgData in msgDataList:
+            if msgData.message_id in deleted or msgData.message_id in shared:
+                self.msg_tracked.discard(msgData)
+        self.metrics.inc("bam_deletes_total", report.deleted, labels='result="deleted"')
+        self.metrics.inc("bam_deletes_total", report.failed, labels='result="failed"')
+        return report
 
     # Just log for now when a member joins the server
     @commands.Cog.listener()
     async def on_member_join(self, member):
-        log.info(f"Member {member.name} ({member.id}) joined {member.guild.name}")
+        self.metrics.inc("bam_events_total", labels='type="member_join"')
+        if self.verbose_logging:
+            log.info(f"Member {member.name} ({member.id}) joined {member.guild.name}")
+        self.scan_scheduler.prioritize(member.guild.id)
 
-    # Detect when a member updates their roles
-    # and send a message in the specified channel if the role is detected
+    # Detect when a member gets a tracked role
+    # and send a message in the specified channel (once per burst of updates)
     @commands.Cog.listener()
     async def on_member_update(self, before, after):
-        before_roles = set(role.id for role in before.roles)
-        after_roles = set(role.id for role in after.roles)
-        new_roles = after_roles - before_roles
+        self.metrics.inc("bam_events_total", labels='type="member_update"')
+        key = (after.guild.id, after.id)
+        # A member already waiting for evaluation is evaluated with its latest state
+        self.member_updates.update(key, after)
+
+        before_roles = member_role_ids(before)
+        after_roles = member_role_ids(after)
+        if before_roles == after_roles: # Nickname, avatar, timeout... changes
+            return
+
+        self.track_role_changes(after, set(before_roles), set(after_roles))
+
+    # Keep the roster current with a role change and notify the tracked roles added
+    def track_role_changes(self, member: discord.Member, before_roles: set[int], after_roles: set[int]):
+        new_roles = self.role_index.enabled_ids.intersection(after_roles - before_roles)
+
+        # Keep the roster current for detection and the next delta scan
+        for role_id in new_roles:
+            self.role_snapshots.add(role_id, member.id)
+        for role_id in self.role_index.enabled_ids.intersection(before_roles - after_roles):
+            self.role_snapshots.discard(role_id, member.id)
+
+        if not new_roles:
+            return
 
-        log.info(f"Member {after.name} ({after.id}) updated in {after.guild.name}. New roles: {new_roles}")
+        self.metrics.inc("bam_role_matches_total", labels='type="member_update"')
+        if self.verbose_logging:
+            log.info(f"Member {member.name} ({member.id}) updated in {member.guild.name}. New tracked roles: {new_roles}")
+        self.member_updates.push((member.guild.id, member.id), member)
+        self.scan_scheduler.prioritize(member.guild.id)
 
-        await self.send_message(after, after.guild)
+    # discord.py drops the updates of the members missing from its cache before dispatching on_member_update.
+    # Hook the gateway parser so the bot can run with a minimal member cache: the updates of uncached
+    # members are compared with the roster instead.
+    def hook_member_updates(self):
+        parsers: typing.Optional[dict] = getattr(self.bot._connection, "parsers", None)
+        if parsers is None or "GUILD_MEMBER_UPDATE" not in parsers or self.member_update_parser is not None:
+            return
+        self.member_update_parser = original = parsers["GUILD_MEMBER_UPDATE"]
+
+        def parse_guild_member_update(data):
+            try:
+                self.on_uncached_member_update(data)
+            except Exception as e:
+                log.error(f"Failed to process member update: {e}")
+            original(data)
+        parsers["GUILD_MEMBER_UPDATE"] = parse_guild_member_update
+
+    def unhook_member_updates(self):
+        if self.member_update_parser is not None:
+            self.bot._connection.parsers["GUILD_MEMBER_UPDATE"] = self.member_update_parser
+            self.member_update_parser = None
+
+    def on_uncached_member_update(self, data: dict):
+        guild = self.bot.get_guild(int(data["guild_id"]))
+        if guild is None:
+            return
+        member_id = int(data["user"]["id"])
+        if guild.get_member(member_id) is not None:
+            return # Handled by on_member_update
+        self.metrics.inc("bam_events_total", labels='type="uncached_member_update"')
+
+        tracked_ids = [detected_role.id for detected_role in self.role_index.roles_for_guild(guild)]
+        if not tracked_ids:
+            return
+        before_roles = self.role_snapshots.roles_of(member_id, tracked_ids)
+        after_roles = self.role_index.enabled_ids.intersection(int(role_id) for role_id in data.get("roles", ()))
+        if before_roles == after_roles:
+            return
+        member = discord.Member(data=data, guild=guild, state=self.bot._connection)
+        self.track_role_changes(member, before_roles, after_roles)
+
+    async def evaluate_member_update(self, member: discord.Member):
+        if not self.work_queue.put(member.guild, member, "role"):
+            log.error(f"Work queue full, dropping role update of {member.name} ({member.id})")
+
+    # Delete the tracked message when the member leaves the server (cached or not)
+    @commands.Cog.listener()
+    async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent):
+        self.metrics.inc("bam_events_total", labels='type="member_remove"')
+        if self.verbose_logging:
+            log.info(f"Member {payload.user.name} ({payload.user.id}) removed from guild {payload.guild_id}")
+        guild = self.bot.get_guild(payload.guild_id)
+        if guild is not None:
+            self.role_snapshots.discard_member(payload.user.id, (detected_role.id for detected_role in self.role_index.roles_for_guild(guild)))
+        await self.delete_role_message(payload.guild_id, payload.user.id)
+
+    # Keep the resolved entities cache consistent with the guilds
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        self.entities.forget_role(role.id)
+        if self.role_index.get_config(role.id) is not None:
+            log.info(f"Tracked role {role.name} ({role.id}) deleted from {role.guild.name}")
+            self.role_index.update(role.id)
+            self.role_snapshots.drop(role.id)
 
-    # Delete the tracked message when the member leaves the server
     @commands.Cog.listener()
-    async def on_member_remove(self, member):
-        log.info(f"Member {member.name} ({member.id}) removed from {member.guild.name} ({member.guild.id})")
-        key = f"{member.guild.id}-{member.id}"
-        await self.delete_role_message(key)
+    async def on_guild_channel_delete(self, channel):
+        self.entities.forget_channel(channel.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        log.info(f"Removed from guild {guild.name} ({guild.id})")
+        self.entities.forget_guild(guild.id)
+        self.role_index.rebuild()
+        self.scan_scheduler.remove(guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        self.entities.clear_missing()
+        self.role_index.rebuild()
+        if self.scan_scheduler.is_running():
+            self.scan_scheduler.add(guild.id)
+
+    # The guilds may not be known yet when the cog is loaded
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # The initial guilds dispatch no join nor available event: resolve what was looked up before them
+        self.entities.clear_missing()
+        self.role_index.rebuild()
+        if self.scan_scheduler.is_running():
+            self.scan_scheduler.sync(guild.id for guild in self.bot.guilds)
+
+    # Guild objects are replaced when a guild becomes available again
+    @commands.Cog.listener()
+    async def on_guild_available(self, guild):
+        self.entities.forget_guild(guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role):
+        self.entities.clear_missing()
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel):
+        self.entities.clear_missing()
 
     @commands.Cog.listener()
     async def on_message(self, message):
         if message.author.bot or not isinstance(message.author, discord.Member):
             return
         
-        for role_to_detect in self.roles_detection:
-            if not role_to_detect["enabled"]:
-                continue
-            emoji = role_to_detect.get("emoji")
-            if not emoji:
-                continue
-            if role_to_detect["id"] in [role.id for role in message.author.roles]:
-                log.info(f"React to message with emoji {emoji}")
+        self.metrics.inc("bam_events_total", labels='type="message"')
+        if not self.role_index.match(message.guild.id, member_role_ids(message.author)):
+            return
+
+        self.metrics.inc("bam_role_matches_total", labels='type="message"')
+        if not self.work_queue.put(message.guild, message.author, "message", message):
+            log.error(f"Work queue full, dropping message {message.id} of {message.author.name} ({message.author.id})")
+
+    # Process the work queued for a member by the listeners
+    async def process_work_item(self, item: WorkItem):
+        started = time.perf_counter()
+        try:
+            await self.process_member(item)
+        finally:
+            self.metrics.observe("bam_work_item_seconds", time.perf_counter() - started)
+
+    async def process_member(self, item: WorkItem):
+        detected_roles = self.role_index.match(item.guild.id, member_role_ids(item.member))
+        if not detected_roles:
+            return
+
+        emoji = next((detected_role.emoji for detected_role in detected_roles if detected_role.emoji), None)
+        if emoji:
+            for message in item.react_to:
+                if self.verbose_logging:
+                    log.info(f"React to message with emoji {emoji}")
                 try:
                     await message.add_reaction(emoji)
                 except Exception as e:
                     log.error(f"Failed to add rection to message {message.id}")
-                break
 
-        await self.send_message(message.author, message.guild, replyParent=message)
+        await self.send_message(item.member, item.guild, replyParent=item.reply_to, detected_roles=detected_roles)
 
     # Send tracked role message
-    async def send_message(self, member: discord.Member, guild: discord.Guild, replyParent: discord.Message = None):
-        for role_to_detect in self.roles_detection:
-            if not role_to_detect["enabled"]:
+    async def send_message(self, member: discord.Member, guild: discord.Guild, replyParent: discord.Message = None, detected_roles: list[CompiledRole] = None):
+        if detected_roles is None:
+            detected_roles = self.role_index.match(guild.id, member_role_ids(member))
+        if self.batch_notifications:
+            await self.send_member_batch(member, guild, detected_roles, replyParent)
+            return
+        for detected_role in detected_roles:
+            if self.verbose_logging:
+                log.info(f"Detected role {detected_role.id} for {member.name} ({member.id}) in {guild.name}")
+            channel = self.entities.get_channel(detected_role.channel_id)
+            if not channel:
+                log.error("No channel to send the message.")
                 continue
-            if role_to_detect["id"] in [role.id for role in member.roles]:
-                log.info(f"Detected role {role_to_detect['id']} for {member.name} ({member.id}) in {member.name}")
-                channel = self.bot.get_channel(role_to_detect["channel_notif"])
-                if not channel:
-                    log.error("No channel to send the message.")
-                    continue
-                await self.send_role_message(role_to_detect["id"], guild, member, channel, role_to_detect["message"], replyParent=replyParent)
+            await self.send_role_message(detected_role.id, guild, member, channel, detected_role.template, forceResendDelay=detected_role.cooldown, replyParent=replyParent)
+
+    # Batching mode: notify all the roles of a member with one message per channel
+    async def send_member_batch(self, member: discord.Member, guild: discord.Guild, detected_roles: list[CompiledRole], replyParent: discord.Message = None):
+        roles_by_channel: dict[int, list[CompiledRole]] = {}
+        for detected_role in detected_roles:
+            if self.verbose_logging:
+                log.info(f"Detected role {detected_role.id} for {member.name} ({member.id}) in {guild.name}")
+            # Replies are all sent in the channel of the parent message
+            channel_id = replyParent.channel.id if replyParent is not None else detected_role.channel_id
+            roles_by_channel.setdefault(channel_id, []).append(detected_role)
+
+        for channel_id, channel_roles in roles_by_channel.items():
+            channel = replyParent.channel if replyParent is not None else self.entities.get_channel(channel_id)
+            if not channel:
+                log.error("No channel to send the message.")
+                continue
+            await self.send_batch_message(guild, channel, [(member, detected_role) for detected_role in channel_roles], replyParent=replyParent)
+
+    # Send one message notifying several (member, role) pairs, tracked for each pair.
+    # Pairs still inside their cooldown are left out, the previous messages of the others are deleted first.
+    # returns True when the message has been sent, False when no pair needs it (cooldowns) and None when sending failed
+    async def send_batch_message(self, guild: discord.Guild, channel: discord.TextChannel, pairs: list[tuple[discord.Member, CompiledRole]], replyParent: discord.Message = None, raiseRateLimit: bool = False) -> typing.Optional[bool]:
+        try:
+            ready: list[tuple[discord.Member, CompiledRole]] = []
+            active = 0
+            for member, detected_role in pairs:
+                if self.is_cooldown_active(guild.id, member.id, detected_role):
+                    active += 1
+                else:
+                    ready.append((member, detected_role))
+            if active:
+                self.metrics.inc("bam_sends_total", active, labels='result="cooldown"')
+            pairs = ready
+            if not pairs:
+                return False
+
+            previous = [msgData for msgData in (self.msg_tracked.get(guild.id, member.id, detected_role.id) for member, detected_role in pairs) if msgData is not None]
+            if previous:
+                await self.delete_tracked_messages(previous)
+
+            content = self.render_batch(pairs)
+            started = time.perf_counter()
+            if replyParent is None:
+                msg = await channel.send(content)
+            else:
+                msg = await replyParent.reply(content, mention_author=True)
+            self.record_send(started)
+
+            timestamp = msg.created_at.timestamp()
+            for member, detected_role in pairs:
+                self.msg_tracked.add(TrackedMessage(guild.id, member.id, detected_role.id, msg.channel.id, msg.id, timestamp))
+            if self.verbose_logging:
+                log.info(f"Message tracked: {msg.id} for {len(pairs)} notification(s) in {guild.name} ({guild.id})")
+            return True
+        except Exception as e:
+            retried = raiseRateLimit and rate_limit_retry_after(e) is not None
+            self.record_send_error(e, failed=not retried)
+            if retried:
+                raise
+            log.error(f"Failed to send message: {e}")
+        return None
+
+    # One section per role (in configuration order) mentioning all its members
+    def render_batch(self, pairs: list[tuple[discord.Member, CompiledRole]]) -> str:
+        members_by_role: dict[int, tuple[CompiledRole, list[int]]] = {}
+        for member, detected_role in pairs:
+            members_by_role.setdefault(detected_role.id, (detected_role, []))[1].append(member.id)
+        sections: list[str] = []
+        for detected_role, member_ids in sorted(members_by_role.values(), key=lambda item: item[0].order):
+            section = detected_role.template.render_many(member_ids)
+            if section not in sections:
+                sections.append(section)
+        return "\n".join(sections)
 
     ####                                  ####
     #       Role Configuration Commands      #
     ####                                  ####
 
     def get_role_config(self, role: discord.Role):
-        for role_config in self.roles_detection:
-            if role_config["id"] == role.id:
-                return role_config
-        return None
+        return self.role_index.get_config(role.id)
+
+    # Find the guild owning a role, used to group the detection index per guild
+    def resolve_role_guild(self, role_id: int) -> typing.Optional[int]:
+        return self.entities.role_guild_id(role_id)
 
     def get_role_info(self, role: discord.Role) -> str:
         role_config = self.get_role_config(role)
@@ -243,30 +855,14 @@ class BAM(commands.Cog):
         return role_info
 
     async def get_channel(self, channel_id: int) -> typing.Optional[discord.TextChannel]:
-        # Try to get the channel from the cache
-        channel = self.bot.get_channel(channel_id)
-        if channel is None:
-            try:
-                # Fetch the channel from the API if not in cache
-                channel = await self.bot.fetch_channel(channel_id)
-            except discord.NotFound:
-                print(f"Channel with ID {channel_id} not found.")
-            except discord.Forbidden:
-                print(f"Bot does not have permission to access channel with ID {channel_id}.")
-            except Exception as e:
-                print(f"An error occurred while fetching the channel: {e}")
-        return channel
+        # From the cache, or fetched from the API (missing channels are remembered for a while)
+        return await self.entities.fetch_channel(channel_id)
 
     async def get_role(self, ctx: commands.Context, role_id: int) -> typing.Optional[discord.Role]:
-        # Search through all guilds the bot is in
-        for guild in self.bot.guilds:
-            role = guild.get_role(role_id)
-            if role is not None:
-                return role
-        
-        # Role not found in any guild
-        log.error(f"Role with ID {role_id} not found in any guild.")
-        return None
+        role = self.entities.get_role(role_id)
+        if role is None:
+            log.error(f"Role with ID {role_id} not found in any guild.")
+        return role
 
     async def enable_role(self, ctx: commands.Context, role: discord.Role, enable: bool) -> None:
         role_config = self.get_role_config(role)
@@ -275,6 +871,10 @@ class BAM(commands.Cog):
             return
         
         role_config["enabled"] = enable
+        self.role_index.update(role.id)
+        self.role_snapshots.drop(role.id)
+        if self.cooldown_scheduler.is_running():
+            self.cooldown_scheduler.rebuild()
         log.info(f"{'En' if enable else 'Dis'}abling role `{role.name}` ({role.id})")
         await log.client(ctx, f"Role `{role.name}` ({role.id}) tracking status: {':white_check_mark:' if enable else ':x:'}")
 
@@ -338,7 +938,7 @@ class BAM(commands.Cog):
                 "cooldown": kwargs.get("cooldown") or 60,
                 "message": kwargs.get("message") or "Default message. Use `role @role message <msg>` to change it."
             }
-            self.roles_detection.append(new_role_config)
+            self.role_index.add(new_role_config)
             await log.success(ctx, f"Role `{role.name}` ({role.id}) now configured. Use `role @role enable` to enable it.")
 
         elif command.lower() == "untrack": # Untrack a role
@@ -348,10 +948,9 @@ class BAM(commands.Cog):
                 return
             
             log.info(f"Try to untrack role `{role.name}` ({role.id}).")
-            for i, tracked_role in enumerate(self.roles_detection):
-                if tracked_role["id"] == role.id:
-                    del self.roles_detection[i]
-                    await log.success(ctx, f"Role `{role.name}` ({role.id}) now untracked.")
+            self.role_index.remove(role.id)
+            self.role_snapshots.drop(role.id)
+            await log.success(ctx, f"Role `{role.name}` ({role.id}) now untracked.")
 
         elif command.lower() == "channel": # Change or display the notification channel
             role_config = self.get_role_config(role)
@@ -368,6 +967,7 @@ class BAM(commands.Cog):
                     converter = commands.TextChannelConverter()
                     channel = await converter.convert(ctx, args)
                     role_config['channel_notif'] = channel.id
+                    self.role_index.update(role.id)
                     await log.success(ctx, f"Notification channel for `{role.name}` ({role.id}) successfully set to: `{channel}`")
                 except Exception as e:
                     await log.failure(ctx, f"Failed to retrieve channel: {e}")
@@ -383,6 +983,7 @@ class BAM(commands.Cog):
             else:
                 log.info(f"Try to set emoji's role `{role.name}` ({role.id}) to {args}.")
                 role_config['emoji'] = args
+                self.role_index.update(role.id)
                 await log.success(ctx, f"Emoji for `{role.name}` ({role.id}) successfully set to: `{role_config['emoji']}`")
 
         elif command.lower() == "message": # Change or display the message
@@ -396,6 +997,7 @@ class BAM(commands.Cog):
             else:
                 log.info(f"Try to set message's role `{role.name}` ({role.id}) to {args}.")
                 role_config['message'] = args
+                self.role_index.update(role.id)
                 await log.success(ctx, f"Message for `{role.name}` ({role.id}) successfully set to: `{role_config['message']}`")
         
         elif command.lower() == "cooldown": # Change or display the cooldown
@@ -411,6 +1013,9 @@ class BAM(commands.Cog):
                     log.info(f"Try to set cooldown's role `{role.name}` ({role.id}) to {args}.")
                     value: int = int(args)
                     role_config['cooldown'] = value
+                    self.role_index.update(role.id)
+                    if self.cooldown_scheduler.is_running():
+                        self.cooldown_scheduler.rebuild()
                     await log.success(ctx, f"Cooldown for `{role.name}` ({role.id}) successfully set to: `{role_config['cooldown']}`")
                 except Exception as e:
                     await log.failure(ctx, f"Failed to set cooldown for `{role.name}` ({role.id}): `{e}`")
@@ -423,28 +1028,430 @@ class BAM(commands.Cog):
     ####                             ####
         
     # Attempt to send a message to all members with a specific role
-    async def fetch_roles(self, guildCtx: discord.Guild = None):
-        for guild in self.bot.guilds:
-            if (guildCtx is not None and guild != guildCtx):
-                continue
+    # Messages are sent through the send pipeline, returns the job once all sends are done
+    # resume continues interrupted stream scans from their checkpoint
+    # delta only processes the role membership changes since the previous delta scan
+    async def fetch_roles(self, guildCtx: discord.Guild = None, resume: bool = False, delta: bool = False) -> SendJob:
+        job = self.create_scan_job("scan all" if guildCtx is None else f"scan {guildCtx.name}")
+        started = time.perf_counter()
+        try:
+            await self.feed_scan(job, guildCtx, resume, delta)
+        finally:
+            await self.close_scan_job(job)
+        try:
+            await job.wait()
+        finally:
+            await self.save_stream_checkpoints(job)
+        duration = time.perf_counter() - started
+        self.metrics.observe("bam_scan_seconds", duration, labels='mode="delta"' if delta else 'mode="full"')
+        if guildCtx is not None:
+            self.scan_durations[guildCtx.id] = duration
+        log.info(f"Scan finished: {job.progress()}")
+        return job
+
+    # The shards of the process are fed concurrently, the send pipeline rate limits each guild on its own
+    async def feed_scan(self, job: SendJob, guildCtx: discord.Guild = None, resume: bool = False, delta: bool = False):
+        if guildCtx is not None:
+            await self.feed_guilds(job, [guildCtx], resume, delta)
+            return
+        shards = self.partition.by_shard(self.bot.guilds)
+        results = await asyncio.gather(*(self.feed_guilds(job, guilds, resume, delta) for guilds in shards.values()), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    async def feed_guilds(self, job: SendJob, guilds: list[discord.Guild], resume: bool, delta: bool):
+        for guild in guilds:
+            if job.cancelled:
+                return
             
             log.info(f"Connected to {guild.name} ({guild.id}) ({guild.member_count} members)")
-            for role_to_detect in self.roles_detection:
-                if not role_to_detect["enabled"]:
-                    continue
+            if delta:
+                await self.feed_guild_delta(job, guild, resume)
+            else:
+                await self.feed_guild_full(job, guild, resume)
+
+    async def feed_guild_full(self, job: SendJob, guild: discord.Guild, resume: bool):
+        # The member cache only lists every member once the guild is chunked
+        if self.scan_mode == "stream" or not guild.chunked:
+            await self.feed_guild_stream(job, guild, resume)
+        else:
+            await self.feed_guild_cached(job, guild)
+
+    # Returns True while the member's tracked message for this role is still inside its cooldown
+    def is_cooldown_active(self, guild_id: int, member_id: int, detected_role: CompiledRole) -> bool:
+        msgData = self.msg_tracked.get(guild_id, member_id, detected_role.id)
+        return msgData is not None and time.time() - msgData.timestamp <= detected_role.cooldown * 60
 
-                role: discord.Role = guild.get_role(role_to_detect["id"])
+    # Create a send job, with a batcher packing its messages in batching mode
+    def create_scan_job(self, name: str) -> SendJob:
+        job = self.pipeline.create_job(name)
+        if self.batch_notifications:
+            async def submit_batch(guild: discord.Guild, channel: discord.TextChannel, pairs: list[tuple[discord.Member, CompiledRole]]):
+                await self.pipeline.submit(job, guild.id, channel.id, functools.partial(self.send_scan_batch, guild, channel, pairs), functools.partial(self.release_scan_sends, job, guild.id, [member.id for member, detected_role in pairs]))
+            self.job_batchers[job] = NotificationBatcher(submit_batch, max_mentions=self.batch_max_mentions)
+        return job
+
+    # Submit the remaining batched messages, no more work will be added to the job
+    async def close_scan_job(self, job: SendJob):
+        try:
+            batcher = self.job_batchers.pop(job, None)
+            if batcher is not None and not job.cancelled:
+                await batcher.flush()
+        finally:
+            job.close()
+
+    # Queue a scan message in the send pipeline.
+    # Members still inside their cooldown are skipped here, without using any rate limit token.
+    async def submit_scan_send(self, job: SendJob, guild: discord.Guild, member: discord.Member, channel: discord.TextChannel, detected_role: CompiledRole):
+        self.role_snapshots.add(detected_role.id, member.id, pending=False)
+        if self.is_cooldown_active(guild.id, member.id, detected_role):
+            self.metrics.inc("bam_sends_total", labels='result="cooldown"')
+            job.skip()
+            return
+        watermark = self.stream_watermarks.get((job, guild.id))
+        if watermark is not None:
+            watermark.hold(member.id)
+        batcher = self.job_batchers.get(job)
+        if batcher is not None:
+            await batcher.add(guild, channel, member, detected_role)
+            return
+        await self.pipeline.submit(job, guild.id, channel.id, functools.partial(self.send_scan_message, guild, member, channel, detected_role), functools.partial(self.release_scan_sends, job, guild.id, [member.id]))
+
+    # Called by the send pipeline once the sends of members are done (or dropped when `processed` is False)
+    def release_scan_sends(self, job: SendJob, guild_id: int, member_ids: list[int], processed: bool):
+        watermark = self.stream_watermarks.get((job, guild_id))
+        if watermark is not None:
+            for member_id in member_ids:
+                watermark.release(member_id, processed)
+
+    # The sends of the interrupted stream scans of a job are over: checkpoint the members they completed
+    async def save_stream_checkpoints(self, job: SendJob):
+        keys = [key for key in self.stream_watermarks if key[0] is job]
+        for key in keys:
+            watermark = self.stream_watermarks.pop(key)
+            if watermark.value is not None:
+                self.scan_checkpoints[key[1]] = watermark.value
+        if keys:
+            await self.save_scan_checkpoints()
+
+    async def send_scan_message(self, guild: discord.Guild, member: discord.Member, channel: discord.TextChannel, detected_role: CompiledRole) -> typing.Optional[bool]:
+        sent = await self.send_role_message(detected_role.id, guild, member, channel, detected_role.template, forceResendDelay=detected_role.cooldown, raiseRateLimit=True)
+        if not sent:
+            self.retry_unsent(guild.id, member.id, detected_role)
+        return sent
+
+    async def send_scan_batch(self, guild: discord.Guild, channel: discord.TextChannel, pairs: list[tuple[discord.Member, CompiledRole]]) -> typing.Optional[bool]:
+        sent = await self.send_batch_message(guild, channel, pairs, raiseRateLimit=True)
+        if not sent:
+            for member, detected_role in pairs:
+                self.retry_unsent(guild.id, member.id, detected_role)
+        return sent
+
+    # A scan message could not be sent: retry at the next delta scan if the member is not tracked,
+    # or after another cooldown period if its cooldown is expired
+    def retry_unsent(self, guild_id: int, member_id: int, detected_role: CompiledRole):
+        msgData = self.msg_tracked.get(guild_id, member_id, detected_role.id)
+        if msgData is None:
+            self.role_snapshots.mark_pending(detected_role.id, member_id)
+        elif self.cooldown_scheduler.is_running() and not self.is_cooldown_active(guild_id, member_id, detected_role):
+            self.cooldown_scheduler.schedule(msgData, time.time() + detected_role.cooldown * 60)
+
+    # Expiration time of a tracked message cooldown, None if its role is not enabled anymore
+    def cooldown_due_time(self, msgData: TrackedMessage) -> typing.Optional[float]:
+        detected_role = self.role_index.enabled.get(msgData.role_id)
+        if detected_role is None:
+            return None
+        return msgData.timestamp + detected_role.cooldown * 60
+
+    # Dry run of a scan: the members a scan would notify, notify again or skip, without any API call.
+    # Members are listed from the member cache when the guild is chunked, from the roster otherwise.
+    def build_scan_plan(self, guildCtx: discord.Guild = None) -> ScanPlan:
+        plan = ScanPlan("scan all" if guildCtx is None else f"scan {guildCtx.name}")
+        guilds = [guildCtx] if guildCtx is not None else [guild for guild in self.bot.guilds if self.partition.owns(guild.id)]
+        now = time.time()
+        for guild in guilds:
+            for detected_role in self.role_index.roles_for_guild(guild):
+                role: discord.Role = guild.get_role(detected_role.id)
                 if role is None:
                     continue
+                if self.entities.get_channel(detected_role.channel_id) is None:
+                    plan.skip_role(guild.id, role.id, "no channel")
+                    continue
+                if guild.chunked:
+                    member_ids = [member.id for member in role.members]
+                elif self.role_snapshots.is_seeded(role.id):
+                    member_ids = self.role_snapshots.members(role.id)
+                else:
+                    plan.skip_role(guild.id, role.id, "members unknown until a scan")
+                    continue
+
+                plan.add_role(guild.id, role.id)
+                for member_id in member_ids:
+                    msgData = self.msg_tracked.get(guild.id, member_id, role.id)
+                    if msgData is None:
+                        action = SEND
+                    elif now - msgData.timestamp <= detected_role.cooldown * 60:
+                        action = SKIP
+                    else:
+                        action = RESEND
+                    plan.add(PlannedOperation(guild.id, member_id, role.id, detected_role.channel_id, action, msgData.message_id if msgData is not None else None, cached=guild.get_member(member_id) is not None))
+        return plan
 
-                log.info(f'- Members with the role {role.name} ({len(role.members)}):')
-                
-                channel = self.bot.get_channel(role_to_detect["channel_notif"])
-                for member in role.members:
+    # Counts per guild and role, API calls and duration estimated from the send pipeline rates
+    def format_scan_plan(self, plan: ScanPlan) -> str:
+        messages = plan.messages_by_channel(self.batch_max_mentions if self.batch_notifications else 1)
+        queued = self.pipeline.queue.qsize()
+        queries = plan.lookup_queries(QUERY_MEMBERS_MAX if self.bot.intents.members else 1)
+        lines = [
+            f"Plan of `{plan.name}`: {plan.total(SEND)} to send, {plan.total(RESEND)} to resend, {plan.total(SKIP)} skipped (cooldown)",
+            f"API calls: {sum(messages.values())} messages, up to {plan.deletes()} deletes, {queries} member queries ({plan.lookups()} members not cached)",
+            f"Estimated duration: {format_duration(self.pipeline.estimate(messages))}" + (f" once the {queued} queued messages are sent" if queued else "")
+            + (f", plus the time of the {queries} member queries" if queries else ""),
+        ]
+        guild_id = None
+        for (role_guild_id, role_id), (send, resend, skip) in sorted(plan.counts.items()):
+            if role_guild_id != guild_id:
+                guild_id = role_guild_id
+                guild = self.bot.get_guild(guild_id)
+                lines.append(f"- `{shorten(guild.name if guild is not None else guild_id)}`:")
+            lines.append(f"  - <@&{role_id}>: {send} send, {resend} resend, {skip} skip")
+        for role_guild_id, role_id, reason in plan.unplanned:
+            lines.append(f"- <@&{role_id}> not planned: {reason}")
+        lines.append("Use `scan plan run` to execute it.")
+        text = "\n".join(lines)
+        return text if len(text) <= MESSAGE_MAX_LENGTH else shorten(text, MESSAGE_MAX_LENGTH - 40) + "\n(use `scan plan` per server)"
+
+    # Execute a plan as a single send job. The members are checked again when sending:
+    # those who lost the role since are dropped, and cooldowns started since are skipped
+    async def run_scan_plan(self, plan: ScanPlan) -> SendJob:
+        job = self.create_scan_job(f"plan of {plan.name}")
+        # Members not cached when planning, per guild in the order of the operations,
+        # resolved QUERY_MEMBERS_MAX at a time when the first of them is reached
+        lookups: dict[int, list[int]] = {}
+        for operation in plan.operations:
+            if not operation.cached:
+                lookups.setdefault(operation.guild_id, []).append(operation.member_id)
+        lookups = {guild_id: list(dict.fromkeys(member_ids)) for guild_id, member_ids in lookups.items()}
+        lookup_positions: dict[int, int] = {}
+        resolved: dict[tuple[int, int], typing.Optional[discord.Member]] = {}
+        try:
+            for operation in plan.operations:
+                if job.cancelled:
+                    break
+                guild = self.bot.get_guild(operation.guild_id)
+                detected_role = self.role_index.enabled.get(operation.role_id)
+                channel = self.entities.get_channel(detected_role.channel_id) if detected_role is not None else None
+                if guild is None or channel is None:
+                    job.skip()
+                    continue
+                member = guild.get_member(operation.member_id)
+                if member is None:
+                    key = (guild.id, operation.member_id)
+                    if key not in resolved and not operation.cached:
+                        position = lookup_positions.get(guild.id, 0)
+                        chunk = lookups[guild.id][position:position + QUERY_MEMBERS_MAX]
+                        lookup_positions[guild.id] = position + len(chunk)
+                        members = await self.query_members(guild, chunk)
+                        resolved.update(((guild.id, member_id), members.get(member_id)) for member_id in chunk)
+                    # Members evicted from the cache since planning are fetched one by one
+                    member = resolved[key] if key in resolved else await self.fetch_member(guild, operation.member_id)
+                if member is None or detected_role.id not in member_role_ids(member):
+                    self.role_snapshots.discard(detected_role.id, operation.member_id)
+                    job.skip()
+                    continue
+                await self.submit_scan_send(job, guild, member, channel, detected_role)
+        finally:
+            await self.close_scan_job(job)
+        await job.wait()
+        log.info(f"Scan plan finished: {job.progress()}")
+        return job
+
+    # Resend the tracked messages whose role cooldown expired (called by the cooldown scheduler)
+    async def resend_expired(self, msgDataList: list[TrackedMessage]):
+        job = self.create_scan_job("cooldown resends")
+        try:
+            for msgData in msgDataList:
+                guild = self.bot.get_guild(msgData.guild_id)
+                detected_role = self.role_index.enabled.get(msgData.role_id)
+                if guild is None or detected_role is None:
+                    continue
+                member = guild.get_member(msgData.member_id) or await self.fetch_member(guild, msgData.member_id)
+                if member is None or detected_role.id not in member_role_ids(member):
+                    self.role_snapshots.discard(detected_role.id, msgData.member_id)
+                    continue
+                channel = self.entities.get_channel(detected_role.channel_id)
+                if channel is None:
+                    continue
+                await self.submit_scan_send(job, guild, member, channel, detected_role)
+        finally:
+            await self.close_scan_job(job)
+
+    # Resolve members by id, QUERY_MEMBERS_MAX per gateway query (one by one without the members intent
+    # or when a query fails). Members gone, or which could not be fetched, are missing from the result
+    async def query_members(self, guild: discord.Guild, member_ids: list[int]) -> dict[int, discord.Member]:
+        if not self.bot.intents.members:
+            members = [await self.fetch_member(guild, member_id) for member_id in member_ids]
+            return {member.id: member for member in members if member is not None}
+        found: dict[int, discord.Member] = {}
+        for i in range(0, len(member_ids), QUERY_MEMBERS_MAX):
+            chunk = member_ids[i:i + QUERY_MEMBERS_MAX]
+            try:
+                members = await guild.query_members(user_ids=chunk, cache=False)
+            except Exception as e:
+                log.error(f"Failed to query members of {guild.name} ({guild.id}), fetching them one by one: {e}")
+                members = [member for member in [await self.fetch_member(guild, member_id) for member_id in chunk] if member is not None]
+            found.update((member.id, member) for member in members)
+        return found
+
+    async def fetch_member(self, guild: discord.Guild, member_id: int) -> typing.Optional[discord.Member]:
+        try:
+            return await guild.fetch_member(member_id)
+        except discord.NotFound:
+            return None
+        except Exception as e:
+            log.error(f"Failed to fetch member {member_id} in {guild.name} ({guild.id}): {e}")
+            return None
+
+    # Process only the members added to the tracked roles since the previous tick,
+    # expired cooldowns are handled by the cooldown scheduler.
+    # Roles never scanned yet, and every `full_scan_every` ticks, fall back to a full scan.
+    async def feed_guild_delta(self, job: SendJob, guild: discord.Guild, resume: bool):
+        detected_roles = self.role_index.roles_for_guild(guild)
+        ticks = self.delta_ticks.get(guild.id, 0)
+        self.delta_ticks[guild.id] = ticks + 1
+        if ticks % self.full_scan_every == 0 or not all(self.role_snapshots.is_seeded(detected_role.id) for detected_role in detected_roles):
+            log.info(f"Full scan of {guild.name} ({guild.id})")
+            await self.feed_guild_full(job, guild, resume)
+            return
+
+        for detected_role in detected_roles:
+            channel = self.entities.get_channel(detected_role.channel_id)
+            if channel is None:
+                log.error(f"No channel to send the message for role {detected_role.id}.")
+                continue
+
+            member_ids = list(self.role_snapshots.take_pending(detected_role.id))
+            if not member_ids:
+                continue
+            log.info(f"- Delta scan of role {detected_role.id}: {len(member_ids)} members")
+            for i, member_id in enumerate(member_ids):
+                if job.cancelled:
+                    # Keep the remaining members for the next tick
+                    for remaining_id in member_ids[i:]:
+                        self.role_snapshots.mark_pending(detected_role.id, remaining_id)
+                    return
+                member = guild.get_member(member_id) or await self.fetch_member(guild, member_id)
+                if member is None or detected_role.id not in member_role_ids(member):
+                    self.role_snapshots.discard(detected_role.id, member_id)
+                    continue
+                await self.submit_scan_send(job, guild, member, channel, detected_role)
+
+    # Scan the members of the tracked roles known by the member cache
+    async def feed_guild_cached(self, job: SendJob, guild: discord.Guild):
+        for detected_role in self.role_index.roles_for_guild(guild):
+            role: discord.Role = guild.get_role(detected_role.id)
+            if role is None:
+                continue
+
+            members = role.members
+            log.info(f'- Members with the role {role.name} ({len(members)}):')
+            self.role_snapshots.seed(role.id, (member.id for member in members))
+            
+            channel = self.entities.get_channel(detected_role.channel_id)
+            if channel is None:
+                log.error(f"No channel to send the message for role {role.name} ({role.id}).")
+                continue
+
+            for member in members:
+                if job.cancelled:
+                    return
+                if self.verbose_logging:
                     log.info(f"  - {member.name} ({member.id})")
-                    sent = await self.send_role_message(role.id, guild, member, channel, role_to_detect["message"], forceResendDelay = role_to_detect.get("cooldown") or 60)
-                    if sent:
-                        await asyncio.sleep(1)
+                await self.submit_scan_send(job, guild, member, channel, detected_role)
+
+    # Page through all the guild members (1000 per API call) and keep only those holding a tracked role,
+    # so memory stays flat whatever the guild size. The highest member id whose sends (and those of every
+    # member before it) are done is checkpointed every SCAN_CHECKPOINT_INTERVAL members, when the scan is
+    # interrupted, and once the sends of an interrupted scan are over (see save_stream_checkpoints).
+    async def feed_guild_stream(self, job: SendJob, guild: discord.Guild, resume: bool):
+        detected_roles = self.role_index.roles_for_guild(guild)
+        if not detected_roles:
+            return
+
+        kwargs = {}
+        after = self.scan_checkpoints.get(guild.id) if resume else None
+        if after is not None:
+            kwargs["after"] = discord.Object(id=after)
+        log.info(f"Streaming members of {guild.name} ({guild.id}) from {after or 'start'}")
+
+        channels: dict[int, typing.Optional[discord.abc.GuildChannel]] = {}
+        # A listing from the start replaces the roster, members come sorted by id
+        roster: typing.Optional[dict[int, list[int]]] = {detected_role.id: [] for detected_role in detected_roles} if after is None else None
+        watermark = CompletionWatermark(after)
+        self.stream_watermarks[(job, guild.id)] = watermark
+        count = 0
+        completed = False
+        try:
+            async for member in guild.fetch_members(limit=None, **kwargs):
+                if job.cancelled:
+                    break
+                # Held while the member is submitted, so it is not done before all its sends are
+                watermark.hold(member.id)
+                for detected_role in self.role_index.match(guild.id, member_role_ids(member)):
+                    if roster is not None and detected_role.id in roster:
+                        roster[detected_role.id].append(member.id)
+                    if detected_role.channel_id not in channels:
+                        channels[detected_role.channel_id] = self.entities.get_channel(detected_role.channel_id)
+                    channel = channels[detected_role.channel_id]
+                    if channel is None:
+                        continue
+                    await self.submit_scan_send(job, guild, member, channel, detected_role)
+                watermark.release(member.id)
+                count += 1
+                if count % SCAN_CHECKPOINT_INTERVAL == 0 and watermark.value is not None:
+                    self.scan_checkpoints[guild.id] = watermark.value
+                    await self.save_scan_checkpoints()
+            else:
+                completed = True
+        finally:
+            if completed:
+                self.stream_watermarks.pop((job, guild.id), None)
+                self.scan_checkpoints.pop(guild.id, None)
+                for detected_role in detected_roles:
+                    if roster is not None:
+                        self.role_snapshots.replace(detected_role.id, roster[detected_role.id])
+                    else:
+                        self.role_snapshots.mark_seeded(detected_role.id)
+            elif watermark.value is not None:
+                self.scan_checkpoints[guild.id] = watermark.value
+            await self.save_scan_checkpoints()
+            log.info(f"Streamed {count} members of {guild.name} ({guild.id}){'' if completed else f', checkpoint at {watermark.value}'}")
+
+    # `scan all` in a cluster: every live process scans its own guilds at the same time
+    async def scan_cluster(self, ctx: commands.Context):
+        try:
+            nodes = [node[0] for node in await self.coordinator.live_nodes() if node[0] != self.coordinator.cluster_id]
+            request_id = await self.coordinator.broadcast("scan all")
+        except Exception as e:
+            await log.failure(ctx, f"Failed to reach the cluster, scanning the local guilds only: {e}")
+            nodes, request_id = [], None
+        job = await self.fetch_roles()
+        results: dict[int, str] = {}
+        if request_id is not None and nodes:
+            try:
+                results = await self.coordinator.wait_acks(request_id, nodes, self.cluster_request_timeout)
+            except Exception as e:
+                log.error(f"Failed to read the scan results of the cluster: {e}")
+        lines = [f"- cluster {self.coordinator.cluster_id}: {job.progress()}"] + [f"- cluster {cluster_id}: {results.get(cluster_id, 'no answer')}" for cluster_id in nodes]
+        await log.client(ctx, shorten("Scan finished:\n" + "\n".join(lines), MESSAGE_MAX_LENGTH), delete_after=20)
+
+    # Requests broadcast by the other processes of the cluster
+    async def handle_cluster_request(self, command: str) -> str:
+        if command == "scan all":
+            job = await self.fetch_roles()
+            return job.progress()
+        return f"unknown request: {command}"
 
     async def enable_scan(self, ctx: commands.Context | discord.Interaction, enable: bool):
         log.info(f"{'En' if enable else 'Dis'}abling periodic scan...")
@@ -467,11 +1474,43 @@ class BAM(commands.Cog):
 
         if command is None:
             log.info(f"Scan current guild roles")
-            await self.fetch_roles(ctx.guild)
+            job = await self.fetch_roles(ctx.guild)
+            await log.client(ctx, f"Scan finished: {job.progress()}", delete_after=20)
 
         elif command.lower() == "all":
             log.info(f"Scan all roles")
-            await self.fetch_roles()
+            if self.coordinator is not None and self.coordinator.is_running():
+                await self.scan_cluster(ctx)
+                return
+            job = await self.fetch_roles()
+            await log.client(ctx, f"Scan finished: {job.progress()}", delete_after=20)
+
+        elif command.lower() == "status":
+            if not self.pipeline.jobs:
+                await log.client(ctx, "No scan has been run yet.", delete_after=20)
+                return
+            await log.client(ctx, "Scans:\n" + "\n".join(f"- {job.progress()}" for job in self.pipeline.jobs), delete_after=20)
+
+        elif command.lower() == "plan":
+            # `scan plan [all]` computes what a scan would do, `scan plan run` executes the last plan
+            if len(args) > 0 and args[0].lower() == "run":
+                plan = self.scan_plan
+                if plan is None:
+                    await log.failure(ctx, "No scan plan to run, use `scan plan` first.", delete_after=20)
+                    return
+                self.scan_plan = None
+                job = await self.run_scan_plan(plan)
+                await log.client(ctx, f"Scan plan finished: {job.progress()}", delete_after=20)
+                return
+            self.scan_plan = self.build_scan_plan(None if len(args) > 0 and args[0].lower() == "all" else ctx.guild)
+            # The plan lists roles as mentions, a dry run must not ping their members
+            await ctx.send(self.format_scan_plan(self.scan_plan), delete_after=120, allowed_mentions=discord.AllowedMentions.none())
+
+        elif command.lower() == "cancel":
+            running_jobs = self.pipeline.running_jobs()
+            for job in running_jobs:
+                job.cancel()
+            await log.success(ctx, f"{len(running_jobs)} running scan(s) cancelled.")
 
         elif command.lower() == "enable":
             enable = True
@@ -487,32 +1526,60 @@ class BAM(commands.Cog):
                 await self.enable_scan(ctx, False)
 
         elif command.lower() == "interval":
+            # `here` reads or overrides the interval of the current guild only
+            here = len(args) > 0 and args[-1].lower() == "here"
+            if here:
+                args = args[:-1]
             if len(args) > 0:
                 try:
                     new_interval: int = int(args[0])
-                    log.info(f"Set scan interval to '{new_interval}'")
-                    self.periodic_scan.change_interval(minutes=new_interval)
-                    self.config["periodic_scan_interval"] = new_interval
-                    await log.success(ctx, f"Periodic scan interval successfully set to {new_interval}.")
+                    if here:
+                        log.info(f"Set scan interval of {ctx.guild.name} ({ctx.guild.id}) to '{new_interval}'")
+                        overrides = self.config.setdefault("periodic_scan_guild_intervals", {})
+                        if new_interval > 0:
+                            self.scan_scheduler.overrides[ctx.guild.id] = new_interval * 60
+                            overrides[str(ctx.guild.id)] = new_interval
+                        else: # 0 removes the override
+                            self.scan_scheduler.overrides.pop(ctx.guild.id, None)
+                            overrides.pop(str(ctx.guild.id), None)
+                    else:
+                        log.info(f"Set scan interval to '{new_interval}'")
+                        self.scan_scheduler.interval = new_interval * 60
+                        self.config["periodic_scan_interval"] = new_interval
+                    self.scan_scheduler.reschedule()
+                    await log.success(ctx, f"Periodic scan interval successfully set to {new_interval}{' for this server' if here else ''}.")
                 except Exception as e:
                     await log.failure(ctx, f"Error when trying to change scan interval: {e}")
             else:
                 log.info(f"Display current scan interval")
-                await log.client(ctx, f"Current scan interval is set to {int(self.periodic_scan.minutes)}")
+                message = f"Current scan interval is set to {int(self.scan_scheduler.interval // 60)}"
+                if ctx.guild.id in self.scan_scheduler.overrides:
+                    message += f" ({int(self.scan_scheduler.overrides[ctx.guild.id] // 60)} for this server)"
+                next_scan = self.scan_scheduler.next_scan_in(ctx.guild.id)
+                if next_scan is not None:
+                    message += f", next scan of this server in {format_age(next_scan)}"
+                await log.client(ctx, message)
         
         else:
-            await log.client(ctx, f"Unkown command {command}.\nAvailable commands:\n- `enable [on/off]`\n- `disable` (equivalent to `enable off`)\n- `interval [<value>]`\n- `all`\n- no command (scan current server)", delete_after=20)
+            await log.client(ctx, f"Unkown command {command}.\nAvailable commands:\n- `status`\n- `cancel`\n- `enable [on/off]`\n- `disable` (equivalent to `enable off`)\n- `interval [<value>] [here]`\n- `all`\n- no command (scan current server)", delete_after=20)
 
     ####                              ####
     #           Misc Commands            #
     ####                              ####
 
     # Test command to see if the BAM module is working
-    @commands.command()
+    @commands.group(invoke_without_command=True)
     async def bam(self, ctx):
         await ctx.message.delete()
         await ctx.send("BAM!", delete_after=10)
 
+    # `bam stats` shows the counters, gauges and latencies collected since startup (of every server)
+    @bam.command(name="stats")
+    @predicate.admin_only()
+    async def bam_stats(self, ctx):
+        await ctx.message.delete()
+        await ctx.send(shorten(self.metrics.summary(), MESSAGE_MAX_LENGTH), delete_after=60)
+
     # Delete all tracked messages
     @commands.command(aliases=["ctm"])
     @predicate.admin_only()
@@ -522,39 +1589,108 @@ class BAM(commands.Cog):
         count: int = len(self.msg_tracked)
         log.info(f"Cleaning up {count} tracked messages...")
 
-        for key, msgData in self.msg_tracked.items():
-            log.info(f"Trying to delete message {key}")
-            for msgDatum in msgData:
-                msg = await self.get_message(msgDatum['channel'], msgDatum['id'])
-                if msg is not None:
-                    try:
-                        await msg.delete()
-                    except Exception as e:
-                        log.error(f"Error deleting message {key}: {e}")
+        report = await self.delete_tracked_messages(list(self.msg_tracked))
 
         self.msg_tracked.clear()
-        log.info("Cleanup complete.")
-        await log.success(ctx, f"{count} tracked message sucessfully cleared.")
+        log.info(f"Cleanup complete: {report.deleted} deleted, {report.failed} failed.")
+        await log.success(ctx, f"{count} tracked message sucessfully cleared.\n{report.summary()}")
+
+    # Filter the tracked messages from `key=value` arguments: guild, role, member, older/newer (in minutes)
+    # Listing filters, shared by the local store and the rows published by the other processes of the cluster
+    def parse_tracked_filters(self, kwargs: dict[str, str]) -> dict[str, typing.Optional[float]]:
+        now = time.time()
+        return {
+            "guild_id": int(kwargs["guild"]) if "guild" in kwargs else None,
+            "role_id": int(kwargs["role"]) if "role" in kwargs else None,
+            "member_id": int(kwargs["member"]) if "member" in kwargs else None,
+            "older": now - float(kwargs["older"]) * 60 if "older" in kwargs else None,
+            "newer": now - float(kwargs["newer"]) * 60 if "newer" in kwargs else None,
+        }
+
+    def filter_tracked_messages(self, filters: dict[str, typing.Optional[float]]) -> list[TrackedMessage]:
+        guild_id, role_id, member_id = filters["guild_id"], filters["role_id"], filters["member_id"]
+        older, newer = filters["older"], filters["newer"]
+
+        msgDataList = self.msg_tracked.for_guild(guild_id) if guild_id is not None else self.msg_tracked
+        return [
+            msgData for msgData in msgDataList
+            if (role_id is None or msgData.role_id == role_id)
+            and (member_id is None or msgData.member_id == member_id)
+            and (older is None or msgData.timestamp <= older)
+            and (newer is None or msgData.timestamp >= newer)
+        ]
 
+    # One listing line per tracked message, names are resolved from the client cache only
+    def format_tracked_message(self, msgData: TrackedMessage, now: float) -> str:
+        guild = self.bot.get_guild(msgData.guild_id)
+        channel = self.entities.get_channel(msgData.channel_id)
+        guild_name = shorten(guild.name if guild is not None else msgData.guild_id)
+        channel_name = shorten(channel.name if channel is not None else msgData.channel_id)
+        return f"- Message `{msgData.message_id}` for <@{msgData.member_id}> (role <@&{msgData.role_id}>) in channel `{channel_name}` in guild `{guild_name}`, {format_age(now - msgData.timestamp)} ago"
+
+    # Check in background if the tracked messages still exist, and report the missing ones
+    # (grouped by channel and read from the history, within the reconciler API budget)
+    async def check_tracked_messages(self, ctx: commands.Context, msgDataList: list[TrackedMessage]):
+        try:
+            missing = await self.reconciler.find_missing(msgDataList)
+        except Exception as e:
+            await log.failure(ctx, f"Failed to check the tracked messages: {e}", delete_after=60)
+            return
+        await log.client(ctx, f"Checked {len(msgDataList)} tracked messages: {len(missing)} no longer exist.\nReconciler: {self.reconciler.summary()}", delete_after=60)
+
+    # List tracked messages: `stm [check] [page=<n>] [guild=<id>] [role=<id>] [member=<id>] [older=<minutes>] [newer=<minutes>]`
     @commands.command(aliases=["stm"])
     @predicate.admin_only()
-    async def showTrackedMessages(self, ctx: commands.Context):
+    async def showTrackedMessages(self, ctx: commands.Context, *, args: str = None):
         await ctx.message.delete()
         log.info("Displaying tracked messages.")
-        msg_list = "Tracked messages:\n"
-        for key, msgData in self.msg_tracked.items():
-            for msgDatum in msgData:
-                try:
-                    guild = self.bot.get_guild(msgDatum["guild"]) or await self.bot.fetch_guild(msgDatum["guild"])
-                    channel = guild.get_channel(msgDatum["channel"]) or await guild.fetch_channel(msgDatum["channel"])
-                    msg = await self.get_message(channel.id, msgDatum["id"])
-                    msg_list += f"- Message `{msg.id}` in channel `{channel.name}` in guild `{guild.name}`\n"
-                except Exception as e:
-                    log.error(f"Failed to retrieve message {key}: {e}")
-                    msg_list += f"- Message `{msgDatum['id']}` in channel `{msgDatum['channel']}` in guild `{msgDatum['guild']}` (deleted)\n"
-        msg_list += f"Total tracked messages: {len(self.msg_tracked)}"
-        
-        await ctx.send(msg_list, delete_after=20)
+
+        check = False
+        kwargs: dict[str, str] = dict()
+        if args is not None:
+            if args.split(maxsplit=1)[0].lower() == "check":
+                check = True
+                args = args[len("check"):].strip() or None
+        if args is not None:
+            try:
+                kwargs = kwargparse.parse_kwargs(args)
+            except kwargparse.UnexpectedToken as e:
+                await log.failure(ctx, f"Unexpected token: {e}", delete_after=20)
+                return
+
+        try:
+            filters = self.parse_tracked_filters(kwargs)
+            msgDataList = self.filter_tracked_messages(filters)
+            page_index = int(kwargs.get("page") or 1)
+        except ValueError as e:
+            await log.failure(ctx, f"Invalid argument: {e}", delete_after=20)
+            return
+
+        # Only the local messages can be checked, the other processes own their channels
+        if check:
+            # A copy: the listing below is extended with the remote entries
+            task = asyncio.get_running_loop().create_task(self.check_tracked_messages(ctx, list(msgDataList)))
+            self.background_tasks.add(task)
+            task.add_done_callback(self.background_tasks.discard)
+
+        total = len(self.msg_tracked)
+        if self.coordinator is not None and self.coordinator.is_running():
+            try:
+                msgDataList += await self.coordinator.remote_tracked(**filters)
+                total += sum(node[2] for node in await self.coordinator.live_nodes() if node[0] != self.coordinator.cluster_id)
+            except Exception as e:
+                log.error(f"Failed to read the tracked messages of the cluster: {e}")
+
+        now = time.time()
+        msgDataList.sort(key=lambda msgData: msgData.timestamp, reverse=True)
+        pages = page_count(len(msgDataList))
+        page_index = max(1, min(page_index, pages))
+        msg_list = f"Tracked messages (page {page_index}/{pages}):\n"
+        for msgData in msgDataList[(page_index - 1) * PAGE_SIZE:page_index * PAGE_SIZE]:
+            msg_list += self.format_tracked_message(msgData, now) + "\n"
+        msg_list += f"Total tracked messages: {len(msgDataList)}" + (f" (out of {total})" if len(msgDataList) != total else "")
+
+        await ctx.send(msg_list[:MESSAGE_MAX_LENGTH], delete_after=20, allowed_mentions=discord.AllowedMentions.none())
 
     @commands.command()
     @predicate.admin_only()
@@ -562,9 +1698,9 @@ class BAM(commands.Cog):
         await ctx.message.delete()
         log.info("Flush.")
         try:
-            self.save_tracked_messages()
-            self.config["roles"] = self.roles_detection
-            filehelper.saveConfig(module = "bam", data = self.config)
+            await self.save_tracked_messages()
+            await self.save_config()
         except Exception as e:
-            log.failure(ctx, f"Failed to flush: {e}")
+            await log.failure(ctx, f"Failed to flush: {e}")
+            return
         await log.success(ctx, "Flushed.")
@@ -0,0 +1,166 @@
+import asyncio
+import bisect
+import os
+import time
+import typing
+import log
+
+# Latency buckets in seconds, from 1ms to 1 minute
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Cumulative histogram with fixed buckets, observing is a binary search and two additions
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets: tuple = buckets
+        self.counts: list[int] = [0] * (len(buckets) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    # Upper bound of the bucket holding the given quantile
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+# In-process counters, histograms and gauges. Counters and histograms are plain dict updates
+# keyed by (name, labels), `labels` being the preformatted Prometheus label string (e.g. 'result="sent"').
+# Gauges are callbacks read when rendering, returning a value or a {labels: value} dict.
+class Metrics:
+    def __init__(self):
+        self.started: float = time.time()
+        self.counters: dict[tuple[str, str], float] = {}
+        self.histograms: dict[tuple[str, str], Histogram] = {}
+        self.gauges: dict[str, typing.Callable[[], typing.Union[float, dict[str, float]]]] = {}
+        self.help: dict[str, str] = {}
+
+    def inc(self, name: str, value: float = 1, labels: str = "") -> None:
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: str = "") -> None:
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def gauge(self, name: str, callback: typing.Callable[[], typing.Union[float, dict[str, float]]], help: str = None) -> None:
+        self.gauges[name] = callback
+        if help:
+            self.help[name] = help
+
+    def describe(self, name: str, help: str) -> None:
+        self.help[name] = help
+
+    def counter(self, name: str, labels: str = "") -> float:
+        return self.counters.get((name, labels), 0)
+
+    def _gauge_values(self) -> list[tuple[str, str, float]]:
+        values = []
+        for name, callback in self.gauges.items():
+            try:
+                value = callback()
+            except Exception as e:
+                log.error(f"Failed to read gauge {name}: {e}")
+                continue
+            if isinstance(value, dict):
+                values.extend((name, labels, gauge_value) for labels, gauge_value in value.items())
+            else:
+                values.append((name, "", value))
+        return values
+
+    # Prometheus text exposition format
+    def render_prometheus(self) -> str:
+        lines: list[str] = []
+        typed: set[str] = set()
+
+        def header(name: str, metric_type: str):
+            if name in typed:
+                return
+            typed.add(name)
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        def sample(name: str, labels: str, value: float):
+            lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+
+        for (name, labels), value in sorted(self.counters.items()):
+            header(name, "counter")
+            sample(name, labels, value)
+        for name, labels, value in sorted(self._gauge_values()):
+            header(name, "gauge")
+            sample(name, labels, value)
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            header(name, "histogram")
+            prefix = f"{labels}," if labels else ""
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                sample(f"{name}_bucket", f'{prefix}le="{bound}"', cumulative)
+            sample(f"{name}_bucket", f'{prefix}le="+Inf"', histogram.count)
+            sample(f"{name}_sum", labels, histogram.sum)
+            sample(f"{name}_count", labels, histogram.count)
+        return "\n".join(lines) + "\n"
+
+    # Short human readable summary
+    def summary(self) -> str:
+        lines = [f"Uptime: {int(time.time() - self.started)}s"]
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f"- {name}{'{' + labels + '}' if labels else ''}: {value:g}")
+        for name, labels, value in sorted(self._gauge_values()):
+            lines.append(f"- {name}{'{' + labels + '}' if labels else ''}: {value:g}")
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            mean = histogram.sum / histogram.count if histogram.count else 0.0
+            lines.append(f"- {name}{'{' + labels + '}' if labels else ''}: {histogram.count} obs, mean {mean * 1000:.1f}ms, p50 <= {histogram.quantile(0.5) * 1000:g}ms, p99 <= {histogram.quantile(0.99) * 1000:g}ms")
+        return "\n".join(lines)
+
+# Periodically writes the metrics to a Prometheus text file (e.g. for the node exporter textfile collector).
+# The text is rendered on the event loop and written atomically in a worker thread.
+class PrometheusFileWriter:
+    def __init__(self, metrics: Metrics, path: str, interval: float = 15.0):
+        self.metrics: Metrics = metrics
+        self.path: str = path
+        self.interval: float = interval
+        self._task: typing.Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _write(self, text: str) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(text)
+        os.replace(tmp_path, self.path)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self._write, self.metrics.render_prometheus())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error(f"Failed to write metrics to {self.path}: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,294 @@
+import asyncio
+import collections
+import time
+import typing
+import discord
+import log
+
+# Returns the delay requested by a rate limit error, or None if the error is not a rate limit
+def rate_limit_retry_after(error: Exception) -> typing.Optional[float]:
+    if isinstance(error, discord.RateLimited):
+        return error.retry_after
+    if isinstance(error, discord.HTTPException) and error.status == 429:
+        try:
+            return float(error.response.headers.get("Retry-After", 1))
+        except (AttributeError, TypeError, ValueError):
+            return 1.0
+    return None
+
+# Classic token bucket: `rate` tokens per second, up to `capacity` tokens.
+# A 429 response blocks the bucket until its retry-after delay has elapsed.
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate: float = rate
+        self.capacity: float = capacity
+        self.tokens: float = capacity
+        self.updated: float = time.monotonic()
+        self.blocked_until: float = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds to wait before a token is available
+    def delay(self, now: float) -> float:
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def consume(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def penalize(self, retry_after: float) -> None:
+        self.tokens = 0
+        self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+# Progress of a batch of sends submitted to the pipeline (e.g. a scan).
+# Each send returns True when sent, False when not needed (skipped) and None when it failed.
+class SendJob:
+    def __init__(self, name: str):
+        self.name: str = name
+        self.submitted: int = 0
+        self.completed: int = 0
+        self.sent: int = 0
+        self.skipped: int = 0
+        self.failed: int = 0
+        self.rate_limited: int = 0
+        self.cancelled: bool = False
+        self.started_at: float = time.monotonic()
+        self.finished_at: typing.Optional[float] = None
+        self._closed: bool = False
+        self._done = asyncio.Event()
+
+    @property
+    def pending(self) -> int:
+        return self.submitted - self.completed
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    # No more work will be submitted, the job is done once the pending items are processed
+    def close(self) -> None:
+        self._closed = True
+        self._check_done()
+
+    # Count an item handled without going through the pipeline
+    def skip(self) -> None:
+        self.submitted += 1
+        self._complete(False)
+
+    async def wait(self) -> None:
+        await self._done.wait()
+
+    def _complete(self, result: typing.Optional[bool]) -> None:
+        self.completed += 1
+        if result is True:
+            self.sent += 1
+        elif result is False:
+            self.skipped += 1
+        else:
+            self.failed += 1
+        self._check_done()
+
+    def _check_done(self) -> None:
+        if self._closed and self.completed >= self.submitted and not self._done.is_set():
+            self.finished_at = time.monotonic()
+            self._done.set()
+
+    def progress(self) -> str:
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        state = "cancelled" if self.cancelled else ("done" if self.done else "running")
+        return f"`{self.name}` ({state}, {elapsed:.0f}s): {self.completed}/{self.submitted} processed, {self.sent} sent, {self.skipped} skipped, {self.failed} failed, {self.rate_limited} rate limited"
+
+# Highest key of an ordered stream (e.g. member ids of a paged listing) whose work is all done.
+# Keys are added in increasing order and held once per pending item, the watermark moves past a key
+# once it is released as many times and every lower key is done too. The watermark never moves past
+# a key released without being processed (cancelled, dropped).
+class CompletionWatermark:
+    def __init__(self, start: typing.Optional[int] = None):
+        self.value: typing.Optional[int] = start
+        self._pending: collections.OrderedDict[int, int] = collections.OrderedDict()
+        self._blocked_at: typing.Optional[int] = None
+
+    def hold(self, key: int) -> None:
+        self._pending[key] = self._pending.get(key, 0) + 1
+
+    def release(self, key: int, processed: bool = True) -> None:
+        if not processed and (self._blocked_at is None or key < self._blocked_at):
+            self._blocked_at = key
+        if key in self._pending:
+            self._pending[key] -= 1
+        self._advance()
+
+    def _advance(self) -> None:
+        while self._pending:
+            key, pending = next(iter(self._pending.items()))
+            if pending > 0 or (self._blocked_at is not None and key >= self._blocked_at):
+                return
+            self._pending.popitem(last=False)
+            self.value = key
+
+class _SendItem:
+    __slots__ = ("job", "guild_id", "channel_id", "factory", "attempts", "on_done")
+
+    def __init__(self, job: SendJob, guild_id: int, channel_id: int, factory: typing.Callable[[], typing.Awaitable[typing.Optional[bool]]], on_done: typing.Optional[typing.Callable[[bool], None]] = None):
+        self.job: SendJob = job
+        self.guild_id: int = guild_id
+        self.channel_id: int = channel_id
+        self.factory = factory
+        self.attempts: int = 0
+        self.on_done = on_done
+
+    # `processed` is False when the item is dropped without being sent (cancelled, stopped, too many rate limits)
+    def complete(self, result: typing.Optional[bool], processed: bool = True) -> None:
+        self.job._complete(result)
+        if self.on_done is not None:
+            self.on_done(processed)
+
+# Bounded pool of workers sending messages under per-channel and per-guild token buckets.
+# Submitting waits when the queue is full, so producers are slowed down to the sending rate.
+# `on_give_up` is called when a send is dropped after too many rate limits.
+class SendPipeline:
+    def __init__(self, workers: int = 4, queue_size: int = 1000, channel_rate: float = 1.0, channel_burst: int = 5, guild_rate: float = 5.0, guild_burst: int = 10, max_retries: int = 3, on_give_up: typing.Optional[typing.Callable[[], None]] = None):
+        self.worker_count: int = workers
+        self.channel_rate: float = channel_rate
+        self.channel_burst: int = channel_burst
+        self.guild_rate: float = guild_rate
+        self.guild_burst: int = guild_burst
+        self.max_retries: int = max_retries
+        self.on_give_up = on_give_up
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.jobs: list[SendJob] = []
+        self._channel_buckets: dict[int, TokenBucket] = {}
+        self._guild_buckets: dict[int, TokenBucket] = {}
+        self._workers: list[asyncio.Task] = []
+        self._stopped: bool = False
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._stopped = False
+        loop = asyncio.get_running_loop()
+        self._workers = [loop.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def stop(self) -> None:
+        self._stopped = True
+        for job in self.jobs:
+            job.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._drain()
+
+    # Release the jobs waiting for their remaining items, nothing processes the queue anymore
+    def _drain(self) -> None:
+        while not self.queue.empty():
+            item: _SendItem = self.queue.get_nowait()
+            item.complete(False, processed=False)
+
+    def create_job(self, name: str) -> SendJob:
+        # Keep the finished jobs around for a while to report them
+        self.jobs = [job for job in self.jobs if not job.done] + [job for job in self.jobs if job.done][-5:]
+        job = SendJob(name)
+        self.jobs.append(job)
+        return job
+
+    def running_jobs(self) -> list[SendJob]:
+        return [job for job in self.jobs if not job.done]
+
+    # `on_done` is called once the item is completed, with False if it has been dropped without being sent
+    async def submit(self, job: SendJob, guild_id: int, channel_id: int, factory: typing.Callable[[], typing.Awaitable[typing.Optional[bool]]], on_done: typing.Optional[typing.Callable[[bool], None]] = None) -> None:
+        job.submitted += 1
+        item = _SendItem(job, guild_id, channel_id, factory, on_done)
+        if self._stopped:
+            item.complete(False, processed=False)
+            return
+        await self.queue.put(item)
+        # Stopped while waiting for room in the queue: the drain happened before this item was put
+        if self._stopped:
+            self._drain()
+
+    # Seconds needed to send `counts[(guild_id, channel_id)]` messages under the bucket rates, from the tokens
+    # currently available. The API latency and the items already queued are not taken into account.
+    def estimate(self, counts: dict[tuple[int, int], int]) -> float:
+        now = time.monotonic()
+        per_guild: dict[int, int] = {}
+        duration = 0.0
+        for (guild_id, channel_id), count in counts.items():
+            per_guild[guild_id] = per_guild.get(guild_id, 0) + count
+            duration = max(duration, self._drain_time(self._channel_buckets.get(channel_id), count, self.channel_rate, self.channel_burst, now))
+        for guild_id, count in per_guild.items():
+            duration = max(duration, self._drain_time(self._guild_buckets.get(guild_id), count, self.guild_rate, self.guild_burst, now))
+        return duration
+
+    def _drain_time(self, bucket: typing.Optional[TokenBucket], count: int, rate: float, burst: int, now: float) -> float:
+        if bucket is None:
+            return max(0.0, count - burst) / rate
+        tokens = min(bucket.capacity, bucket.tokens + (now - bucket.updated) * bucket.rate)
+        return max(0.0, bucket.blocked_until - now) + max(0.0, count - tokens) / bucket.rate
+
+    def _bucket(self, buckets: dict[int, TokenBucket], key: int, rate: float, burst: int) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+    async def _acquire(self, item: _SendItem) -> None:
+        channel_bucket = self._bucket(self._channel_buckets, item.channel_id, self.channel_rate, self.channel_burst)
+        guild_bucket = self._bucket(self._guild_buckets, item.guild_id, self.guild_rate, self.guild_burst)
+        while True:
+            now = time.monotonic()
+            wait = max(channel_bucket.delay(now), guild_bucket.delay(now))
+            if wait <= 0:
+                channel_bucket.consume(now)
+                guild_bucket.consume(now)
+                return
+            await asyncio.sleep(wait)
+
+    async def _worker(self) -> None:
+        while True:
+            item: _SendItem = await self.queue.get()
+            try:
+                await self._process(item)
+            except asyncio.CancelledError:
+                item.complete(False, processed=False)
+                raise
+            except Exception as e:
+                log.error(f"Send pipeline failure: {e}")
+                item.complete(None)
+            finally:
+                self.queue.task_done()
+
+    async def _process(self, item: _SendItem) -> None:
+        while True:
+            if item.job.cancelled:
+                item.complete(False, processed=False)
+                return
+            await self._acquire(item)
+            try:
+                result = await item.factory()
+                item.complete(result)
+                return
+            except Exception as e:
+                retry_after = rate_limit_retry_after(e)
+                if retry_after is None:
+                    raise
+                item.job.rate_limited += 1
+                item.attempts += 1
+                log.error(f"Rate limited in channel {item.channel_id}, retrying after {retry_after}s")
+                self._bucket(self._channel_buckets, item.channel_id, self.channel_rate, self.channel_burst).penalize(retry_after)
+                if item.attempts > self.max_retries:
+                    if self.on_give_up is not None:
+                        self.on_give_up()
+                    item.complete(None, processed=False)
+                    return
@@ -0,0 +1,78 @@
+import math
+import time
+import typing
+
+SEND = "send"
+RESEND = "resend"
+SKIP = "skip"
+
+# A (member, role) pair of a scan plan: `send` a first message, `resend` after the cooldown
+# (the previous message `message_id` is deleted first) or `skip` while inside the cooldown
+class PlannedOperation:
+    __slots__ = ("guild_id", "member_id", "role_id", "channel_id", "action", "message_id", "cached")
+
+    def __init__(self, guild_id: int, member_id: int, role_id: int, channel_id: int, action: str, message_id: typing.Optional[int] = None, cached: bool = True):
+        self.guild_id: int = guild_id
+        self.member_id: int = member_id
+        self.role_id: int = role_id
+        self.channel_id: int = channel_id
+        self.action: str = action
+        self.message_id: typing.Optional[int] = message_id
+        # False when the member must be fetched to be notified
+        self.cached: bool = cached
+
+# Result of a dry run scan: the operations a scan would do, computed from the tracked messages,
+# the cooldowns and the member cache or roster only, counted per guild and role.
+# Skipped pairs are only counted, the plan keeps the operations to execute.
+class ScanPlan:
+    def __init__(self, name: str):
+        self.name: str = name
+        self.created: float = time.time()
+        self.operations: list[PlannedOperation] = []
+        # (guild id, role id) -> [send, resend, skip]
+        self.counts: dict[tuple[int, int], list[int]] = {}
+        # Roles which could not be planned without API calls (no member cache nor roster yet), or without channel
+        self.unplanned: list[tuple[int, int, str]] = []
+
+    def add(self, operation: PlannedOperation) -> None:
+        counts = self.counts.setdefault((operation.guild_id, operation.role_id), [0, 0, 0])
+        counts[(SEND, RESEND, SKIP).index(operation.action)] += 1
+        if operation.action != SKIP:
+            self.operations.append(operation)
+
+    def add_role(self, guild_id: int, role_id: int) -> None:
+        self.counts.setdefault((guild_id, role_id), [0, 0, 0])
+
+    def skip_role(self, guild_id: int, role_id: int, reason: str) -> None:
+        self.unplanned.append((guild_id, role_id, reason))
+
+    def total(self, action: str) -> int:
+        index = (SEND, RESEND, SKIP).index(action)
+        return sum(counts[index] for counts in self.counts.values())
+
+    # Messages to send per (guild, channel), `max_mentions` members per message in batching mode
+    def messages_by_channel(self, max_mentions: int = 1) -> dict[tuple[int, int], int]:
+        members: dict[tuple[int, int, int], int] = {}
+        for operation in self.operations:
+            key = (operation.guild_id, operation.channel_id, operation.role_id)
+            members[key] = members.get(key, 0) + 1
+        messages: dict[tuple[int, int], int] = {}
+        for (guild_id, channel_id, role_id), count in members.items():
+            messages[(guild_id, channel_id)] = messages.get((guild_id, channel_id), 0) + math.ceil(count / max_mentions)
+        return messages
+
+    # Previous messages deleted by the resends (a message shared by several notifications is deleted once)
+    def deletes(self) -> int:
+        return len({operation.message_id for operation in self.operations if operation.action == RESEND})
+
+    # Members not in the cache, resolved when the plan runs
+    def lookups(self) -> int:
+        return len({(operation.guild_id, operation.member_id) for operation in self.operations if not operation.cached})
+
+    # Member queries resolving the lookups, `batch_size` members of the same guild per query
+    def lookup_queries(self, batch_size: int) -> int:
+        members: dict[int, set[int]] = {}
+        for operation in self.operations:
+            if not operation.cached:
+                members.setdefault(operation.guild_id, set()).add(operation.member_id)
+        return sum(math.ceil(len(member_ids) / batch_size) for member_ids in members.values())
@@ -0,0 +1,192 @@
+import asyncio
+import time
+import typing
+import discord
+import log
+from .deletion import BULK_DELETE_LIMIT, delete_calls
+from .pipeline import TokenBucket
+from .store import TrackedMessage, TrackedMessageStore
+
+HISTORY_PAGE_SIZE = 100
+QUERY_MEMBERS_MAX = 100
+
+# Low priority task walking the tracked messages to drop the entries which can never be deleted
+# or resent: guild left, channel deleted, message deleted by someone else, member gone while offline.
+# The store is walked one channel at a time in batches of `batch_size` entries, messages are
+# checked by reading the channel history around them (100 messages per call) and members by
+# querying them 100 at a time through the gateway. Every API call (deletes included) takes a token
+# from a bucket refilled at `budget` calls per minute.
+# `get_channel` resolves a channel from the cache, `delete` deletes and untracks the entries of members gone.
+class TrackedMessageReconciler:
+    def __init__(self, bot: discord.Client, store: TrackedMessageStore, get_channel: typing.Callable[[int], typing.Any], delete: typing.Callable[[list[TrackedMessage]], typing.Awaitable[typing.Any]], budget: int = 30, batch_size: int = 100, interval: float = 3600, pause: float = 1.0):
+        self.bot = bot
+        self.store: TrackedMessageStore = store
+        self.get_channel = get_channel
+        self.delete = delete
+        self.batch_size: int = batch_size
+        self.interval: float = interval
+        self.pause: float = pause
+        self.bucket = TokenBucket(budget / 60, max(1, budget / 10))
+        self.passes: int = 0
+        self.checked: int = 0
+        self.pruned: int = 0
+        self.api_calls: int = 0
+        self._task: typing.Optional[asyncio.Task] = None
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if not self.is_running():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        await self.bot.wait_until_ready()
+        while True:
+            try:
+                await self.run_pass()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error(f"Tracked messages reconciliation failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _spend(self) -> None:
+        while True:
+            now = time.monotonic()
+            wait = self.bucket.delay(now)
+            if wait <= 0:
+                self.bucket.consume(now)
+                self.api_calls += 1
+                return
+            await asyncio.sleep(wait)
+
+    def _is_live(self, entry: TrackedMessage) -> bool:
+        return self.store.get(entry.guild_id, entry.member_id, entry.role_id) is entry
+
+    # Walk the whole store once, returns the number of entries pruned
+    async def run_pass(self) -> int:
+        pruned = 0
+        for channel_id in self.store.channels():
+            entries = self.store.for_channel(channel_id)
+            entries.sort(key=lambda entry: entry.message_id)
+            for i in range(0, len(entries), self.batch_size):
+                pruned += await self.reconcile_batch(channel_id, entries[i:i + self.batch_size])
+                await asyncio.sleep(self.pause)
+        self.passes += 1
+        self.pruned += pruned
+        log.info(f"Tracked messages reconciled: {pruned} pruned, {len(self.store)} left")
+        return pruned
+
+    # Check a batch of entries of the same channel, returns the number of entries pruned
+    async def reconcile_batch(self, channel_id: int, entries: list[TrackedMessage]) -> int:
+        # Entries may have been removed or replaced while waiting for the budget
+        entries = [entry for entry in entries if self._is_live(entry)]
+        if not entries:
+            return 0
+        self.checked += len(entries)
+
+        guild = self.bot.get_guild(entries[0].guild_id)
+        if guild is not None and guild.unavailable:
+            return 0
+        # Guild channels are all cached, a channel missing from an available guild has been deleted
+        channel = self.get_channel(channel_id) if guild is not None else None
+        if channel is None:
+            return self._discard(entries)
+
+        pruned = 0
+        gone = await self.find_members_gone(guild, entries)
+        if gone:
+            left_entries = [entry for entry in entries if entry.member_id in gone]
+            pruned += await self.delete_entries(channel, left_entries)
+            entries = [entry for entry in entries if entry.member_id not in gone]
+
+        missing = await self.find_missing_messages(channel, entries)
+        return pruned + self._discard(missing)
+
+    # Delete the entries of members gone, at most BULK_DELETE_LIMIT messages at a time, each chunk
+    # taking a token per delete call (one per bulk delete, one per message too old to be bulk deleted).
+    # Returns the number of entries pruned
+    async def delete_entries(self, channel, entries: list[TrackedMessage]) -> int:
+        entries_by_message: dict[int, list[TrackedMessage]] = {}
+        for entry in entries:
+            entries_by_message.setdefault(entry.message_id, []).append(entry)
+        message_ids = sorted(entries_by_message)
+        pruned = 0
+        for i in range(0, len(message_ids), BULK_DELETE_LIMIT):
+            chunk = message_ids[i:i + BULK_DELETE_LIMIT]
+            for _ in range(delete_calls(channel, chunk)):
+                await self._spend()
+            chunk_entries = [entry for message_id in chunk for entry in entries_by_message[message_id] if self._is_live(entry)]
+            await self.delete(chunk_entries)
+            pruned += sum(1 for entry in chunk_entries if not self._is_live(entry))
+        return pruned
+
+    def _discard(self, entries: list[TrackedMessage]) -> int:
+        return sum(1 for entry in entries if self.store.discard(entry))
+
+    # Returns the ids of the members no longer in the guild (needs the members intent)
+    async def find_members_gone(self, guild: discord.Guild, entries: list[TrackedMessage]) -> set[int]:
+        if not self.bot.intents.members:
+            return set()
+        member_ids = sorted({entry.member_id for entry in entries if guild.get_member(entry.member_id) is None})
+        gone: set[int] = set()
+        for i in range(0, len(member_ids), QUERY_MEMBERS_MAX):
+            chunk = member_ids[i:i + QUERY_MEMBERS_MAX]
+            await self._spend()
+            try:
+                members = await guild.query_members(user_ids=chunk, cache=False)
+            except Exception as e:
+                log.error(f"Failed to query members of {guild.name} ({guild.id}): {e}")
+                continue
+            found = {member.id for member in members}
+            gone.update(member_id for member_id in chunk if member_id not in found)
+        return gone
+
+    # Returns the entries whose message no longer exists in the channel.
+    # The history is read from the oldest tracked message, each page covering every
+    # tracked message up to its last message (or all of them when the page is not full).
+    async def find_missing_messages(self, channel, entries: list[TrackedMessage]) -> list[TrackedMessage]:
+        message_ids = sorted({entry.message_id for entry in entries})
+        missing_ids: set[int] = set()
+        i = 0
+        while i < len(message_ids):
+            await self._spend()
+            found: set[int] = set()
+            try:
+                async for message in channel.history(limit=HISTORY_PAGE_SIZE, after=discord.Object(id=message_ids[i] - 1), oldest_first=True):
+                    found.add(message.id)
+            except discord.NotFound:
+                # The channel itself is gone
+                return list(entries)
+            except Exception as e:
+                log.error(f"Failed to read the history of channel {channel.id}: {e}")
+                break
+            window_end = max(found) if len(found) >= HISTORY_PAGE_SIZE else None
+            while i < len(message_ids) and (window_end is None or message_ids[i] <= window_end):
+                if message_ids[i] not in found:
+                    missing_ids.add(message_ids[i])
+                i += 1
+        return [entry for entry in entries if entry.message_id in missing_ids]
+
+    # Returns the entries whose message or channel no longer exists, without pruning them
+    async def find_missing(self, entries: list[TrackedMessage]) -> list[TrackedMessage]:
+        entries_by_channel: dict[int, list[TrackedMessage]] = {}
+        for entry in entries:
+            entries_by_channel.setdefault(entry.channel_id, []).append(entry)
+        missing: list[TrackedMessage] = []
+        for channel_id, channel_entries in entries_by_channel.items():
+            channel = self.get_channel(channel_id)
+            if channel is None:
+                missing.extend(channel_entries)
+            else:
+                missing.extend(await self.find_missing_messages(channel, channel_entries))
+        return missing
+
+    def summary(self) -> str:
+        return f"{self.passes} passes, {self.checked} entries checked, {self.pruned} pruned, {self.api_calls} API calls"
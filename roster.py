@@ -0,0 +1,165 @@
+import array
+import bisect
+import typing
+
+# Sorted array of member ids: 8 bytes per member instead of a set entry plus an int object.
+# Lookups are binary searches, inserts and removals shift the tail of the array.
+class MemberIdSet:
+    __slots__ = ("_ids",)
+
+    def __init__(self, member_ids: typing.Iterable[int] = ()):
+        self._ids = array.array("Q", sorted(set(member_ids)))
+
+    # Build from ids already sorted without duplicates (e.g. a member listing paged by id)
+    @classmethod
+    def from_sorted(cls, member_ids: typing.Iterable[int]) -> "MemberIdSet":
+        return cls.wrap(array.array("Q", member_ids))
+
+    # Use a sorted array without copying it
+    @classmethod
+    def wrap(cls, ids: array.array) -> "MemberIdSet":
+        member_set = cls()
+        member_set._ids = ids
+        return member_set
+
+    def to_array(self) -> array.array:
+        return self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self) -> typing.Iterator[int]:
+        return iter(self._ids)
+
+    def __contains__(self, member_id: int) -> bool:
+        i = bisect.bisect_left(self._ids, member_id)
+        return i < len(self._ids) and self._ids[i] == member_id
+
+    # Returns False if the member was already there
+    def add(self, member_id: int) -> bool:
+        i = bisect.bisect_left(self._ids, member_id)
+        if i < len(self._ids) and self._ids[i] == member_id:
+            return False
+        self._ids.insert(i, member_id)
+        return True
+
+    def discard(self, member_id: int) -> bool:
+        i = bisect.bisect_left(self._ids, member_id)
+        if i < len(self._ids) and self._ids[i] == member_id:
+            del self._ids[i]
+            return True
+        return False
+
+    def nbytes(self) -> int:
+        return self._ids.itemsize * len(self._ids)
+
+# Compact roster of the members holding each tracked role, and the members still to be processed by the next scan tick.
+# Seeded by the scans and kept current from member events, so neither detection nor scans need
+# the discord.py member cache, memory only grows with the members of the tracked roles.
+class RoleMembershipSnapshot:
+    def __init__(self):
+        self._members: dict[int, MemberIdSet] = {}
+        self._pending: dict[int, set[int]] = {}
+        self._seeded: set[int] = set()
+
+    def is_seeded(self, role_id: int) -> bool:
+        return role_id in self._seeded
+
+    def members(self, role_id: int) -> MemberIdSet:
+        return self._members.get(role_id) or MemberIdSet()
+
+    def has(self, role_id: int, member_id: int) -> bool:
+        members = self._members.get(role_id)
+        return members is not None and member_id in members
+
+    # Returns the roles of `role_ids` held by a member according to the roster
+    def roles_of(self, member_id: int, role_ids: typing.Iterable[int]) -> set[int]:
+        return {role_id for role_id in role_ids if self.has(role_id, member_id)}
+
+    def pending_count(self, role_id: int = None) -> int:
+        if role_id is not None:
+            return len(self._pending.get(role_id, ()))
+        return sum(len(pending) for pending in self._pending.values())
+
+    def member_count(self) -> int:
+        return sum(len(members) for members in self._members.values())
+
+    def nbytes(self) -> int:
+        return sum(members.nbytes() for members in self._members.values())
+
+    # Replace the members of a role with a full listing, members not known before are marked pending.
+    # Returns the number of new members
+    def seed(self, role_id: int, member_ids: typing.Iterable[int]) -> int:
+        members = MemberIdSet(member_ids)
+        previous = self._members.get(role_id) or MemberIdSet()
+        added = [member_id for member_id in members if member_id not in previous]
+        pending = self._pending.setdefault(role_id, set())
+        pending.difference_update([member_id for member_id in previous if member_id not in members])
+        pending.update(added)
+        self._members[role_id] = members
+        self._seeded.add(role_id)
+        return len(added)
+
+    # Replace the members of a role with a listing already processed (sorted by id),
+    # only the members no longer holding the role leave the pending set
+    def replace(self, role_id: int, sorted_member_ids: typing.Iterable[int]) -> None:
+        members = MemberIdSet.from_sorted(sorted_member_ids)
+        pending = self._pending.get(role_id)
+        if pending:
+            pending.difference_update([member_id for member_id in pending if member_id not in members])
+        self._members[role_id] = members
+        self._seeded.add(role_id)
+
+    # Flag a role as complete once all its members have been added (e.g. by a streamed scan)
+    def mark_seeded(self, role_id: int) -> None:
+        self._members.setdefault(role_id, MemberIdSet())
+        self._seeded.add(role_id)
+
+    def add(self, role_id: int, member_id: int, pending: bool = True) -> None:
+        members = self._members.get(role_id)
+        if members is None:
+            members = self._members[role_id] = MemberIdSet()
+        added = members.add(member_id)
+        if not pending:
+            # Processed (e.g. by a scan), whether it was known already or not
+            self._pending.get(role_id, set()).discard(member_id)
+        elif added:
+            self._pending.setdefault(role_id, set()).add(member_id)
+
+    def mark_pending(self, role_id: int, member_id: int) -> None:
+        if self.has(role_id, member_id):
+            self._pending.setdefault(role_id, set()).add(member_id)
+
+    def discard(self, role_id: int, member_id: int) -> None:
+        members = self._members.get(role_id)
+        if members is not None:
+            members.discard(member_id)
+        self._pending.get(role_id, set()).discard(member_id)
+
+    def discard_member(self, member_id: int, role_ids: typing.Iterable[int]) -> None:
+        for role_id in role_ids:
+            self.discard(role_id, member_id)
+
+    # Returns and clears the members to process for a role
+    def take_pending(self, role_id: int) -> set[int]:
+        pending = self._pending.pop(role_id, None)
+        return pending if pending is not None else set()
+
+    # Forget a role, it will be fully scanned again
+    def drop(self, role_id: int) -> None:
+        self._members.pop(role_id, None)
+        self._pending.pop(role_id, None)
+        self._seeded.discard(role_id)
+
+    # Plain containers handed to the next instance of the cog (hot reload), the arrays are not copied
+    def export_state(self) -> dict:
+        return {
+            "members": {role_id: members.to_array() for role_id, members in self._members.items()},
+            "pending": self._pending,
+            "seeded": self._seeded,
+        }
+
+    def import_state(self, state: dict) -> None:
+        self._members = {role_id: MemberIdSet.wrap(ids) for role_id, ids in state["members"].items()}
+        self._pending = state["pending"]
+        self._seeded = state["seeded"]
@@ -0,0 +1,129 @@
+import asyncio
+import heapq
+import itertools
+import time
+import typing
+import log
+from .store import TrackedMessage, TrackedMessageStore
+
+# Min-heap of tracked messages ordered by the time their role cooldown expires.
+# The heap is fed by the store mutations (it is registered as a store listener),
+# replaced or removed entries are invalidated lazily when they reach the top of the heap.
+# `due_time` returns the expiration timestamp of an entry, or None if it should not be scheduled.
+# `callback` receives the batch of entries whose cooldown expired.
+class CooldownScheduler:
+    def __init__(self, store: TrackedMessageStore, due_time: typing.Callable[[TrackedMessage], typing.Optional[float]], callback: typing.Callable[[list[TrackedMessage]], typing.Awaitable[None]]):
+        self.store: TrackedMessageStore = store
+        self.due_time = due_time
+        self.callback = callback
+        self._heap: list[tuple[float, int, TrackedMessage]] = []
+        self._sequence = itertools.count()
+        self._stale: int = 0
+        self._wakeup = asyncio.Event()
+        self._task: typing.Optional[asyncio.Task] = None
+        # Set when the heap has been handed over by a previous instance, no rebuild needed to start
+        self._restored: bool = False
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.is_running():
+            return
+        if not self._restored:
+            self.rebuild()
+        self._restored = False
+        self.store.listeners.append(self)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self in self.store.listeners:
+            self.store.listeners.remove(self)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        # Rebind instead of clearing: the heap may have been exported to the next instance
+        self._heap = []
+        self._stale = 0
+
+    # The heap handed to the next instance of the cog (hot reload), captured before stopping
+    def export_state(self) -> typing.Optional[dict]:
+        if not self.is_running():
+            return None
+        return {"heap": self._heap, "stale": self._stale, "sequence": next(self._sequence)}
+
+    def import_state(self, state: typing.Optional[dict]) -> None:
+        if state is None:
+            return
+        self._heap = state["heap"]
+        self._stale = state["stale"]
+        # Keep the tie breakers unique, entries with the same due time must never be compared
+        self._sequence = itertools.count(state["sequence"])
+        self._restored = True
+
+    # Reschedule every tracked entry (e.g. when a role cooldown has changed)
+    def rebuild(self) -> None:
+        self._heap = []
+        for entry in self.store:
+            due = self.due_time(entry)
+            if due is not None:
+                self._heap.append((due, next(self._sequence), entry))
+        heapq.heapify(self._heap)
+        self._stale = 0
+        self._wakeup.set()
+
+    # Schedule an entry at its cooldown expiration, or at the given time
+    def schedule(self, entry: TrackedMessage, due: float = None) -> None:
+        if due is None:
+            due = self.due_time(entry)
+        if due is None:
+            return
+        heapq.heappush(self._heap, (due, next(self._sequence), entry))
+        if self._heap[0][2] is entry:
+            self._wakeup.set()
+
+    # Store listener callbacks
+    def on_add(self, entry: TrackedMessage) -> None:
+        self.schedule(entry)
+
+    def on_remove(self, entry: TrackedMessage) -> None:
+        self._stale += 1
+        # Do not let invalidated entries pile up in the heap
+        if self._stale > 1024 and self._stale > len(self._heap) // 2:
+            self.rebuild()
+
+    def on_clear(self) -> None:
+        self._heap.clear()
+        self._stale = 0
+
+    def _is_live(self, entry: TrackedMessage) -> bool:
+        return self.store.get(entry.guild_id, entry.member_id, entry.role_id) is entry
+
+    def _pop_due(self, now: float) -> list[TrackedMessage]:
+        due_entries = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, entry = heapq.heappop(self._heap)
+            if self._is_live(entry):
+                due_entries.append(entry)
+            elif self._stale > 0:
+                self._stale -= 1
+        return due_entries
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            due_entries = self._pop_due(time.time())
+            if due_entries:
+                try:
+                    await self.callback(due_entries)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    log.error(f"Failed to process expired cooldowns: {e}")
+                continue
+
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
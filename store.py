@@ -0,0 +1,208 @@
+import typing
+
+STORE_FORMAT_VERSION = 2
+
+# A message sent to a member because of one of their tracked roles
+class TrackedMessage:
+    __slots__ = ("guild_id", "member_id", "role_id", "channel_id", "message_id", "timestamp")
+
+    def __init__(self, guild_id: int, member_id: int, role_id: int, channel_id: int, message_id: int, timestamp: float):
+        self.guild_id: int = guild_id
+        self.member_id: int = member_id
+        self.role_id: int = role_id
+        self.channel_id: int = channel_id
+        self.message_id: int = message_id
+        self.timestamp: float = timestamp
+
+    @property
+    def key(self) -> tuple[int, int, int]:
+        return (self.guild_id, self.member_id, self.role_id)
+
+    def to_row(self) -> list:
+        return [self.guild_id, self.member_id, self.role_id, self.channel_id, self.message_id, self.timestamp]
+
+    @classmethod
+    def from_row(cls, row: list) -> "TrackedMessage":
+        return cls(int(row[0]), int(row[1]), int(row[2]), int(row[3]), int(row[4]), float(row[5]))
+
+    def __repr__(self) -> str:
+        return f"TrackedMessage(guild={self.guild_id}, member={self.member_id}, role={self.role_id}, channel={self.channel_id}, id={self.message_id})"
+
+# Tracked messages keyed by (guild, member, role), with secondary indexes by channel and guild.
+# Every lookup and removal is O(1), listing a channel or a guild is O(entries in it).
+class TrackedMessageStore:
+    def __init__(self):
+        self._by_member: dict[tuple[int, int], dict[int, TrackedMessage]] = {}
+        self._by_channel: dict[int, set[TrackedMessage]] = {}
+        self._by_guild: dict[int, set[TrackedMessage]] = {}
+        # Number of entries sharing a message (a message may notify several members or roles)
+        self._message_refs: dict[int, int] = {}
+        self._count: int = 0
+        # Notified of every mutation (see TrackedMessageJournal and CooldownScheduler)
+        self.listeners: list = []
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> typing.Iterator[TrackedMessage]:
+        for entries in self._by_member.values():
+            yield from entries.values()
+
+    def get(self, guild_id: int, member_id: int, role_id: int) -> typing.Optional[TrackedMessage]:
+        entries = self._by_member.get((guild_id, member_id))
+        if entries is None:
+            return None
+        return entries.get(role_id)
+
+    def for_member(self, guild_id: int, member_id: int) -> list[TrackedMessage]:
+        entries = self._by_member.get((guild_id, member_id))
+        return list(entries.values()) if entries else []
+
+    def for_channel(self, channel_id: int) -> list[TrackedMessage]:
+        return list(self._by_channel.get(channel_id, ()))
+
+    def for_guild(self, guild_id: int) -> list[TrackedMessage]:
+        return list(self._by_guild.get(guild_id, ()))
+
+    def message_refs(self, message_id: int) -> int:
+        return self._message_refs.get(message_id, 0)
+
+    def channels(self) -> list[int]:
+        return list(self._by_channel)
+
+    def guilds(self) -> list[int]:
+        return list(self._by_guild)
+
+    # Track a message, replacing (and returning) any previous entry for the same key
+    def add(self, entry: TrackedMessage) -> typing.Optional[TrackedMessage]:
+        entries = self._by_member.setdefault((entry.guild_id, entry.member_id), {})
+        previous = entries.get(entry.role_id)
+        if previous is not None:
+            self._unindex(previous)
+        else:
+            self._count += 1
+        entries[entry.role_id] = entry
+        self._by_channel.setdefault(entry.channel_id, set()).add(entry)
+        self._by_guild.setdefault(entry.guild_id, set()).add(entry)
+        self._message_refs[entry.message_id] = self._message_refs.get(entry.message_id, 0) + 1
+        for listener in self.listeners:
+            listener.on_add(entry)
+        return previous
+
+    def remove(self, guild_id: int, member_id: int, role_id: int) -> typing.Optional[TrackedMessage]:
+        member_key = (guild_id, member_id)
+        entries = self._by_member.get(member_key)
+        if entries is None:
+            return None
+        entry = entries.pop(role_id, None)
+        if entry is None:
+            return None
+        if not entries:
+            del self._by_member[member_key]
+        self._unindex(entry)
+        self._count -= 1
+        for listener in self.listeners:
+            listener.on_remove(entry)
+        return entry
+
+    # Remove an entry only if it is still the one tracked for its key
+    def discard(self, entry: TrackedMessage) -> bool:
+        if self.get(entry.guild_id, entry.member_id, entry.role_id) is not entry:
+            return False
+        self.remove(entry.guild_id, entry.member_id, entry.role_id)
+        return True
+
+    def remove_member(self, guild_id: int, member_id: int) -> list[TrackedMessage]:
+        entries = self._by_member.pop((guild_id, member_id), None)
+        if not entries:
+            return []
+        for entry in entries.values():
+            self._unindex(entry)
+            for listener in self.listeners:
+                listener.on_remove(entry)
+        self._count -= len(entries)
+        return list(entries.values())
+
+    def clear(self) -> None:
+        self._by_member.clear()
+        self._by_channel.clear()
+        self._by_guild.clear()
+        self._message_refs.clear()
+        self._count = 0
+        for listener in self.listeners:
+            listener.on_clear()
+
+    def _unindex(self, entry: TrackedMessage) -> None:
+        for index, index_key in ((self._by_channel, entry.channel_id), (self._by_guild, entry.guild_id)):
+            bucket = index.get(index_key)
+            if bucket is None:
+                continue
+            bucket.discard(entry)
+            if not bucket:
+                del index[index_key]
+        refs = self._message_refs.get(entry.message_id, 0) - 1
+        if refs > 0:
+            self._message_refs[entry.message_id] = refs
+        else:
+            self._message_refs.pop(entry.message_id, None)
+
+    ####                        ####
+    #          Hot reload          #
+    ####                        ####
+
+    # The indexes as plain containers, handed to the next instance of the cog without copying them.
+    # Records are immutable and only accessed by attribute, so records created by a previous
+    # version of this module keep working as is.
+    def export_state(self) -> dict:
+        return {
+            "by_member": self._by_member,
+            "by_channel": self._by_channel,
+            "by_guild": self._by_guild,
+            "message_refs": self._message_refs,
+            "count": self._count,
+        }
+
+    # Adopt the indexes of a previous store, listeners are not notified
+    def import_state(self, state: dict) -> None:
+        self._by_member = state["by_member"]
+        self._by_channel = state["by_channel"]
+        self._by_guild = state["by_guild"]
+        self._message_refs = state["message_refs"]
+        self._count = state["count"]
+
+    ####                        ####
+    #         Serialization        #
+    ####                        ####
+
+    # Serialize the given entries (or the whole store).
+    # Records are never mutated once tracked, so a captured `list(store)` can be serialized from another thread
+    def to_json(self, entries: typing.Iterable[TrackedMessage] = None) -> dict:
+        if entries is None:
+            entries = self
+        return {"version": STORE_FORMAT_VERSION, "entries": [entry.to_row() for entry in entries]}
+
+    # Load from the current format or from the legacy `{"<guild>-<member>": [{...}]}` format.
+    # Returns the number of loaded entries
+    def load_json(self, data: typing.Optional[dict]) -> int:
+        self.clear()
+        if not data:
+            return 0
+        if "version" in data:
+            for row in data.get("entries") or []:
+                self.add(TrackedMessage.from_row(row))
+        else:
+            self.import_legacy(data)
+        return self._count
+
+    def import_legacy(self, data: dict) -> None:
+        for key, msgDataList in data.items():
+            guild_id, _, member_id = key.partition("-")
+            for msgData in msgDataList or []:
+                self.add(TrackedMessage(
+                    int(msgData.get("guild") or guild_id),
+                    int(member_id),
+                    int(msgData["role"]),
+                    int(msgData["channel"]),
+                    int(msgData["id"]),
+                    float(msgData["timestamp"]),
+                ))
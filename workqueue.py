@@ -0,0 +1,111 @@
+import asyncio
+import collections
+import typing
+import log
+
+DROP_NEW = "drop_new"
+DROP_OLDEST = "drop_oldest"
+
+# Work pending for a member: all the reasons it was queued for, merged together
+class WorkItem:
+    __slots__ = ("guild", "member", "reasons", "reply_to", "react_to")
+
+    def __init__(self, guild, member):
+        self.guild = guild
+        self.member = member
+        self.reasons: set[str] = set()
+        self.reply_to = None
+        self.react_to: list = []
+
+    @property
+    def key(self) -> tuple[int, int]:
+        return (self.guild.id, self.member.id)
+
+# Bounded queue of per-member work consumed by a fixed pool of consumers.
+# Items queued for a member already waiting are merged into the pending item.
+# Members are sharded between consumers so the work of one member is never processed concurrently.
+# When `max_depth` members are pending, `policy` either drops the new item or evicts the oldest one.
+class MemberWorkQueue:
+    def __init__(self, handler: typing.Callable[[WorkItem], typing.Awaitable[None]], consumers: int = 4, max_depth: int = 10000, policy: str = DROP_NEW, max_reactions: int = 3):
+        if policy not in (DROP_NEW, DROP_OLDEST):
+            raise ValueError(f"Unknown work queue policy: {policy}")
+        self.handler = handler
+        self.max_depth: int = max_depth
+        self.policy: str = policy
+        self.max_reactions: int = max_reactions
+        self.queued: int = 0
+        self.merged: int = 0
+        self.dropped: int = 0
+        self._shards: list[collections.OrderedDict] = [collections.OrderedDict() for _ in range(consumers)]
+        self._signals: list[asyncio.Semaphore] = [asyncio.Semaphore(0) for _ in range(consumers)]
+        self._size: int = 0
+        self._consumers: list[asyncio.Task] = []
+
+    def __len__(self) -> int:
+        return self._size
+
+    def start(self) -> None:
+        if self._consumers:
+            return
+        loop = asyncio.get_running_loop()
+        self._consumers = [loop.create_task(self._consume(i)) for i in range(len(self._shards))]
+
+    def stop(self) -> None:
+        for consumer in self._consumers:
+            consumer.cancel()
+        self._consumers = []
+
+    # Queue work for a member, returns False if it has been dropped
+    def put(self, guild, member, reason: str, message=None) -> bool:
+        key = (guild.id, member.id)
+        shard_index = hash(key) % len(self._shards)
+        shard = self._shards[shard_index]
+        item = shard.get(key)
+        if item is not None:
+            self.merged += 1
+        else:
+            if self._size >= self.max_depth and not self._evict():
+                self.dropped += 1
+                return False
+            item = shard[key] = WorkItem(guild, member)
+            self._size += 1
+            self._signals[shard_index].release()
+
+        self.queued += 1
+        item.member = member
+        item.reasons.add(reason)
+        if message is not None:
+            item.reply_to = message
+            if len(item.react_to) < self.max_reactions:
+                item.react_to.append(message)
+        return True
+
+    # Make room for a new item according to the policy
+    def _evict(self) -> bool:
+        if self.policy != DROP_OLDEST:
+            return False
+        # Evict from the most loaded shard, its consumer will skip the missing item
+        shard = max(self._shards, key=len)
+        if not shard:
+            return False
+        shard.popitem(last=False)
+        self._size -= 1
+        self.dropped += 1
+        return True
+
+    async def _consume(self, shard_index: int) -> None:
+        shard = self._shards[shard_index]
+        signal = self._signals[shard_index]
+        while True:
+            await signal.acquire()
+            if not shard:
+                # The item has been evicted
+                continue
+            _, item = shard.popitem(last=False)
+            self._size -= 1
+            try:
+                await self.handler(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error(f"Failed to process work for member {item.member.id}: {e}")